@@ -1,228 +1,278 @@
-from bs4 import BeautifulSoup as BS
-from selenium import webdriver as wd
-from selenium.webdriver.chrome.options import Options as CO
-from selenium.webdriver.chrome.service import Service as CS
+import argparse
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
+import requests
 import pandas as pd
 import matplotlib.pyplot as plot
 import numpy as np
 
-def process_age(age_str):
-    if age_str:
-        return age_str.split('-')[0]
-    return age_str
-
-driver_path = r'C:\Windows\chromedriver.exe'
-options = CO()
-options.add_argument("--headless")
-options.add_argument("--disable-gpu")
-chrome_service = CS(executable_path=driver_path)
-browser = wd.Chrome(service=chrome_service, options=options)
-
-pages = {
-    'standard': 'https://fbref.com/en/comps/9/stats/Premier-League-Stats#all_stats_standard',
-    'keepers': "https://fbref.com/en/comps/9/keepers/Premier-League-Stats#all_stats_keeper",
-    'shots' : "https://fbref.com/en/comps/9/shooting/Premier-League-Stats#all_stats_shooting",
-    'passes': "https://fbref.com/en/comps/9/passing/Premier-League-Stats#all_stats_passing",
-    'creation': "https://fbref.com/en/comps/9/gca/Premier-League-Stats#all_stats_gca",
-    'defense' : "https://fbref.com/en/comps/9/defense/Premier-League-Stats#all_stats_defense",
-    'ball_control' : "https://fbref.com/en/comps/9/possession/Premier-League-Stats#all_stats_possession",
-    'additional' : "https://fbref.com/en/comps/9/misc/Premier-League-Stats#all_stats_misc"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.http_cache import ResponseCache
+from pipeline.http_session import create_session as create_http_session
+from pipeline.rate_limit import HostRateLimiter
+from pipeline.player_table import write_player_table, RESULT_PARQUET
+from pipeline.snapshot_store import SnapshotStore
+from pipeline.instrument import span, stage, traced
+from pipeline.browser_pool import BrowserPool
+from fbref_tables import TABLE_SPECS, parse_page
+
+max_workers = 4
+# Pages one Chrome instance loads before it is replaced, capping its memory growth
+browser_max_pages = 40
+per_host_limit = 4
+request_timeout = 30
+# Retries of transient HTTP errors inside the session; fetch_page has no retry loop of its own
+http_retries = 3
+
+partition_dir = 'Exercise 1/partitions'
+# fbref asks scrapers to stay under roughly ten requests a minute
+min_request_interval = 6.0
+job_retries = 3
+
+competitions = {
+    'premier-league': (9, 'Premier-League'),
+    'la-liga': (12, 'La-Liga'),
+    'serie-a': (11, 'Serie-A'),
+    'bundesliga': (20, 'Bundesliga'),
+    'ligue-1': (13, 'Ligue-1')
+}
+
+page_paths = {
+    'standard': 'stats',
+    'keepers': 'keepers',
+    'shots': 'shooting',
+    'passes': 'passing',
+    'creation': 'gca',
+    'defense': 'defense',
+    'ball_control': 'possession',
+    'additional': 'misc'
 }
 
-browser.get(pages['standard'])
-html = browser.page_source
-parser = BS(html, "html.parser")
-main_table = parser.find('table', class_="min_width sortable stats_table shade_zero now_sortable sticky_table eq2 re2 le2")
-headers = main_table.find_all('tr')[1]
-headers = headers.find_all('th')
-for idx in range(len(headers)):
-    headers[idx] = headers[idx].text.strip()
-headers = headers[1:]
-headers[10], headers[11] ='Goals', 'Assists'
-for idx in range(25, 35):
-    headers[idx] = headers[idx] +'/90'
-df = pd.DataFrame(columns=headers)
-df = df.rename(columns={'MP': 'Matches', 'Min': 'Playing Time', 'CrdY': 'Yellows', 'CrdR': 'Reds'})
-table_rows = main_table.find_all('tr')[2:]
-idx = 0
-for r in table_rows:
-    cols = r.find_all('td')
-    values = [col.text for col in cols]
-    if len(values) == 36:
-        df.loc[idx] = values
-        idx += 1
-df['Age'] = df['Age'].apply(process_age)
-selected_cols = ['Player', 'Nation', 'Pos', 'Squad', 'Age', 'Matches', 'Starts', 'Playing Time', 'Goals', 'Assists', 'Yellows', 'Reds', 'xG', 'xAG', "PrgC", "PrgP","PrgR", 'Gls/90', 'Ast/90', 'xG/90', 'xAG/90']
-df = df[selected_cols]
-
-browser.get(pages['shots'])
-html = browser.page_source
-parser = BS(html, 'html.parser')
-shooting_table = parser.find('table', class_="min_width sortable stats_table shade_zero now_sortable sticky_table eq2 re2 le2")
-shoot_headers = shooting_table.find_all('tr')[1]
-shoot_headers = shoot_headers.find_all('th')[1:]
-for i in range(len(shoot_headers)):
-    shoot_headers[i] = shoot_headers[i].text.strip()
-shoot_df = pd.DataFrame(columns=shoot_headers)
-shoot_rows = shooting_table.find_all('tr')[2:]
-row_idx = 0
-for r in shoot_rows:
-    cells = r.find_all('td')
-    vals = [cell.text for cell in cells]
-    if len(vals) == len(shoot_headers):
-        shoot_df.loc[row_idx] = vals
-        row_idx += 1
-keep_cols = ['Player', 'Squad', 'SoT%', 'SoT/90', 'G/Sh', 'Dist']
-shoot_df = shoot_df[keep_cols]
-df = pd.merge(df, shoot_df, on=['Player', 'Squad'], how='left')
-df = df.drop_duplicates(keep='first')
-
-browser.get(pages['passes'])
-html = browser.page_source
-parser = BS(html, 'html.parser')
-pass_table = parser.find('table', class_="min_width sortable stats_table shade_zero now_sortable sticky_table eq2 re2 le2")
-pass_headers = pass_table.find_all('tr')[1]
-pass_headers = pass_headers.find_all('th')[1:]
-for i in range(len(pass_headers)):
-    pass_headers[i] = pass_headers[i].text.strip()
-pass_headers[7], pass_headers[9], pass_headers[14], pass_headers[17], pass_headers[20] = 'Total_Cmp', 'Total_Cmp%' ,'Short_Cmp%', 'Medium_Cmp%','Long_Cmp%'
-pass_df = pd.DataFrame(columns=pass_headers)
-pass_rows = pass_table.find_all('tr')[2:]
-row_idx = 0
-for r in pass_rows:
-    cells = r.find_all('td')
-    vals = [cell.text for cell in cells]
-    if len(vals) == len(pass_headers):
-        pass_df.loc[row_idx] = vals
-        row_idx += 1
-keep_cols = ['Player','Squad', 'Total_Cmp', 'Total_Cmp%', 'TotDist', 'Short_Cmp%', 'Medium_Cmp%', 'Long_Cmp%', 'KP', '1/3', 'PPA', 'CrsPA', 'PrgP']
-pass_df = pass_df[keep_cols].rename(columns={'PrgP':'(Passing)PrgP'})
-df = pd.merge(df, pass_df, on=['Player', 'Squad'], how='left')
-df = df.drop_duplicates(keep='first')
-
-browser.get(pages['creation'])
-html = browser.page_source
-parser = BS(html, 'html.parser')
-gca_table = parser.find('table', class_="min_width sortable stats_table shade_zero now_sortable sticky_table eq2 re2 le2")
-gca_headers = gca_table.find_all('tr')[1]
-gca_headers = gca_headers.find_all('th')[1:]
-for i in range(len(gca_headers)):
-    gca_headers[i] = gca_headers[i].text.strip()
-gca_df = pd.DataFrame(columns=gca_headers)
-gca_rows = gca_table.find_all('tr')[2:]
-row_idx = 0
-for r in gca_rows:
-    cells = r.find_all('td')
-    vals = [cell.text for cell in cells]
-    if len(vals) == len(gca_headers):
-        gca_df.loc[row_idx] = vals
-        row_idx += 1
-keep_cols = ['Player','Squad','SCA', 'SCA90', 'GCA', 'GCA90']
-gca_df = gca_df[keep_cols]
-df = pd.merge(df, gca_df, on=['Player','Squad'], how='left')
-df = df.drop_duplicates(keep='first')
-
-browser.get(pages['defense'])
-html = browser.page_source
-parser = BS(html, 'html.parser')
-def_table = parser.find('table', id="stats_defense")
-def_headers = def_table.find_all('tr')[1]
-def_headers = def_headers.find_all('th')
-for i in range(len(def_headers)):
-    def_headers[i] = def_headers[i].text.strip()
-def_headers[13] = 'challenges' + def_headers[13]
-def_headers = def_headers[1:]
-def_df = pd.DataFrame(columns=def_headers)
-def_rows = def_table.find_all('tr')[2:]
-row_idx = 0
-for r in def_rows:
-    cells = r.find_all('td')
-    vals = [cell.text for cell in cells]
-    if len(vals) == len(def_headers):
-        def_df.loc[row_idx] = vals
-        row_idx += 1
-keep_cols = ['Player', 'Squad', 'Tkl', 'TklW', 'Att', 'Lost', 'Blocks', 'Sh', 'Pass', 'Int']
-def_df = def_df[keep_cols]
-df = pd.merge(df, def_df, on=['Player', 'Squad'], how='left')
-df = df.drop_duplicates(keep='first')
-
-browser.get(pages['ball_control'])
-html = browser.page_source
-parser = BS(html, 'html.parser')
-pos_table = parser.find('table', class_="min_width sortable stats_table shade_zero now_sortable sticky_table eq2 re2 le2")
-pos_headers = pos_table.find_all('tr')[1]
-pos_headers = pos_headers.find_all('th')
-pos_headers = pos_headers[1:]
-for i in range(len(pos_headers)):
-    pos_headers[i] = pos_headers[i].text.strip()
-pos_headers[14], pos_headers[22], pos_headers[23], pos_headers[28] = 'Take-Ons_' + pos_headers[14], 'Carries_' + pos_headers[22], 'Carries_' + pos_headers[23], 'Receiving_' + pos_headers[28]
-pos_df = pd.DataFrame(columns=pos_headers)
-pos_rows = pos_table.find_all('tr')[2:]
-row_idx = 0
-for r in pos_rows:
-    cells = r.find_all('td')
-    vals = [cell.text for cell in cells]
-    if len(vals) == len(pos_headers):
-        pos_df.loc[row_idx] = vals
-        row_idx += 1
-keep_cols = ['Player', 'Squad', 'Touches', 'Def Pen', 'Def 3rd', 'Mid 3rd', 'Att 3rd', 'Att Pen', 'Take-Ons_Att', 'Succ%', 'Tkld%', 'Carries', 'PrgDist', 'Carries_PrgC', 'Carries_1/3', 'CPA', 'Mis', 'Dis', 'Rec', 'Receiving_PrgR']
-pos_df = pos_df[keep_cols]
-df = pd.merge(df, pos_df, on=['Player', 'Squad'], how='left')
-
-browser.get(pages['additional'])
-html = browser.page_source
-parser = BS(html, 'html.parser')
-misc_table = parser.find('table', class_="min_width sortable stats_table shade_zero now_sortable sticky_table eq2 re2 le2")
-misc_headers = misc_table.find_all('tr')[1]
-misc_headers = misc_headers.find_all('th')
-misc_headers = misc_headers[1:]
-for i in range(len(misc_headers)):
-    misc_headers[i] = misc_headers[i].text.strip()
-misc_df = pd.DataFrame(columns=misc_headers)
-misc_rows = misc_table.find_all('tr')[2:]
-row_idx = 0
-for r in misc_rows:
-    cells = r.find_all('td')
-    vals = [cell.text for cell in cells]
-    if len(vals) == len(misc_headers):
-        misc_df.loc[row_idx] = vals
-        row_idx += 1
-keep_cols = ['Player', 'Squad', 'Fls', 'Fld', 'Off', 'Crs', 'Recov', 'Won', 'Lost', 'Won%']
-misc_df = misc_df[keep_cols].rename(columns={'Lost': '(Misc)Lost'})
-df = pd.merge(df, misc_df, on=['Player', 'Squad'], how='left')
-
-browser.get(pages['keepers'])
-html = browser.page_source
-parser = BS(html, 'html.parser')
-gk_table = parser.find('table', id="stats_keeper")
-gk_headers = gk_table.find_all('tr')[1]
-gk_headers = gk_headers.find_all('th')[1:]
-for i in range(len(gk_headers)):
-    gk_headers[i] = gk_headers[i].text.strip()
-gk_headers[24] = "Penalty_" + gk_headers[24]
-gk_df = pd.DataFrame(columns=gk_headers)
-gk_rows = gk_table.find_all('tr')[2:]
-row_idx = 0
-for r in gk_rows:
-    cells = r.find_all('td')
-    vals = [cell.text for cell in cells]
-    if len(vals) == len(gk_headers):
-        gk_df.loc[row_idx] = vals
-        row_idx += 1
-
-keep_cols = ['Player', 'Squad', 'GA90', 'Save%', 'CS%', 'Penalty_Save%']
-gk_df = gk_df[keep_cols]
-df = pd.merge(df, gk_df, on=['Player', 'Squad'], how='left')
-
-df['Playing Time'] = pd.to_numeric(
-    df['Playing Time'].astype(str).str.replace(',', '', regex=False),
-    errors='coerce'
-)
-df = df[df['Playing Time'] > 90].sort_values(by='Player').reset_index(drop=True)
-df = df.replace('', np.nan)
-df = df.fillna('N/a')
-df = df.rename(columns={'Pos':'Position', 'Squad':'Team'})
-df.to_csv('Exercise 1/result.csv', na_rep='N/a', index=False)
-
-print("Data successfully saved to result.csv")
-browser.quit()
\ No newline at end of file
+def page_url(competition, season, name):
+    """Build the fbref URL of one stat page; season None means the current season"""
+    comp_id, slug = competitions[competition]
+    if season is None:
+        return f"https://fbref.com/en/comps/{comp_id}/{page_paths[name]}/{slug}-Stats"
+    return f"https://fbref.com/en/comps/{comp_id}/{season}/{page_paths[name]}/{season}-{slug}-Stats"
+
+pages = {name: page_url('premier-league', None, name) for name in page_paths}
+
+def create_browser_pool(size=1):
+    """Warm headless drivers for pages HTTP cannot serve; none starts until a page needs one
+
+    The pool finds the chromedriver binary itself (chromedriver_path), the
+    same way as for Ex4, and only once a driver actually starts.
+    """
+    return BrowserPool(size=size, max_pages=browser_max_pages)
+
+def create_session(pool_size=max_workers):
+    """Build a keep-alive HTTP session with a connection pool and polite retries"""
+    return create_http_session(pool_size, retries=http_retries)
+
+def fetch_page(name, url, cache, session=None, browser_pool=None, throttle=None):
+    """Return the HTML of one stat page from the cache, the HTTP session or a browser"""
+    table_id = TABLE_SPECS[name]['table_id']
+    # Only pages holding the table are cached or reused; a bot check never is
+    marker = f'id="{table_id}"'
+    # Fresh cache entries (or any entry when offline) skip the network entirely
+    cached = cache.cached_or_none(url, marker)
+    if cached is not None:
+        return cached
+    if throttle is not None:
+        throttle(urlparse(url).netloc)
+    if session is not None:
+        try:
+            # fbref ships secondary tables inside HTML comments, which the parser reads directly
+            html = cache.fetch(session, url, timeout=request_timeout, marker=marker)
+            if marker in html:
+                return html
+            print(f"Table {table_id} missing from HTTP response, falling back to browser")
+        except requests.RequestException as e:
+            print(f"HTTP fetch of {name} failed ({e}), falling back to browser")
+    # The browser only has to wait for this page's table, not for the whole page
+    html = browser_pool.fetch(url, f'table#{table_id}')
+    if marker in html:
+        cache.store(url, html)
+    return html
+
+def fetch_pages(pages, backend='http', cache=None, workers=max_workers, host_limit=per_host_limit):
+    """Fetch every page concurrently and yield (name, html) as each one completes"""
+    cache = cache or ResponseCache()
+    # Drivers are not thread-safe; the pool lends each one to a single thread at a time
+    browser_pool = create_browser_pool(min(workers, len(pages)))
+    session = create_session(min(workers, len(pages))) if backend == 'http' and not cache.offline else None
+    host_slots = {}
+    for url in pages.values():
+        host = urlparse(url).netloc
+        if host not in host_slots:
+            host_slots[host] = threading.BoundedSemaphore(host_limit)
+
+    def fetch(name, url):
+        with host_slots[urlparse(url).netloc], span('fetch', page=name):
+            return fetch_page(name, url, cache, session, browser_pool)
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pages))) as pool:
+            futures = {pool.submit(fetch, name, url): name for name, url in pages.items()}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    finally:
+        if session is not None:
+            session.close()
+        browser_pool.close()
+
+# State of one scheduler worker process, filled in by init_worker
+worker_state = {}
+
+def init_worker(limiter, backend, cache_ttl, offline):
+    worker_state['limiter'] = limiter
+    worker_state['cache'] = ResponseCache(ttl=cache_ttl, offline=offline)
+    worker_state['session'] = create_session(1) if backend == 'http' and not offline else None
+    worker_state['browser_pool'] = create_browser_pool()
+    # Pool workers exit without running atexit handlers, but multiprocessing finalizers do run
+    from multiprocessing.util import Finalize
+    Finalize(worker_state['browser_pool'], worker_state['browser_pool'].close, exitpriority=10)
+
+def partition_path(competition, season, name):
+    return os.path.join(partition_dir, competition, season or 'current', f'{name}.csv')
+
+def run_job(job, retries=job_retries):
+    """Fetch and parse one (competition, season, page) task and write its partition"""
+    competition, season, name = job
+    url = page_url(competition, season, name)
+    for attempt in range(retries):
+        try:
+            with span('fetch', page=name, competition=competition, season=season or 'current'):
+                html = fetch_page(name, url, worker_state['cache'], worker_state['session'],
+                                  worker_state['browser_pool'], worker_state['limiter'].wait)
+            frame = parse_page(name, html)
+            break
+        except (requests.RequestException, ValueError) as e:
+            if attempt == retries - 1:
+                raise
+            delay = min_request_interval * 2 ** attempt
+            print(f"{competition} {season or 'current'} {name} failed ({e}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+    path = partition_path(competition, season, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame.to_csv(path, index=False)
+    return job, path
+
+def read_partition(path):
+    # Keep the raw cell strings exactly as parsed so the join sees what a direct parse would
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+def run_scheduler(competition_list, seasons, backend, cache_ttl, offline, processes, interval):
+    """Expand (competition, season, page) tasks over a process pool and combine the partitions"""
+    jobs = [(competition, season, name)
+            for competition in competition_list for season in seasons for name in page_paths]
+    limiter = HostRateLimiter({urlparse(page_url(*job)).netloc for job in jobs}, 0 if offline else interval)
+    finished = {}
+    combined = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker,
+                             initargs=(limiter, backend, cache_ttl, offline)) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            (competition, season, name), path = future.result()
+            done = finished.setdefault((competition, season), {})
+            done[name] = path
+            # Join a league-season as soon as its last page lands
+            if len(done) == len(page_paths):
+                frame = join_tables({page: read_partition(p) for page, p in done.items()})
+                frame.insert(0, 'Season', season or 'current')
+                frame.insert(0, 'Competition', competition)
+                combined.append(frame)
+                print(f"Finished {competition} {season or 'current'} ({len(frame)} players)")
+    return pd.concat(combined, ignore_index=True)
+
+join_order = ['standard', 'shots', 'passes', 'creation', 'defense', 'ball_control', 'additional', 'keepers']
+
+def index_by_player(frame, name):
+    """Index a table by (fbref player id, falling back to the name, team) and report duplicate keys"""
+    key = frame['Player ID'].where(frame['Player ID'] != '', frame['Player'])
+    frame = frame.set_index([key.rename('Key'), 'Team'], drop=False)
+    duplicated = frame.index.duplicated(keep='first')
+    if duplicated.any():
+        names = ', '.join(frame.loc[duplicated, 'Player'].astype(str).unique()[:5])
+        print(f"Warning: {duplicated.sum()} duplicate player rows in the {name} table kept only once ({names})")
+    return frame[~duplicated]
+
+@traced('merge')
+def join_tables(tables):
+    """Left-join every stat table onto the standard table in a single aligned pass"""
+    base = index_by_player(tables['standard'], 'standard')
+    frames = [base]
+    for name in join_order[1:]:
+        frame = index_by_player(tables[name], name).drop(columns=['Player', 'Team', 'Player ID'])
+        missing = (~frame.index.isin(base.index)).sum()
+        if missing:
+            print(f"Warning: {missing} rows in the {name} table have no match in the standard table")
+        frames.append(frame.reindex(base.index))
+    joined = pd.concat(frames, axis=1)
+    # Keep the id as the last column so existing consumers see the same layout
+    columns = [col for col in joined.columns if col != 'Player ID'] + ['Player ID']
+    return joined[columns].reset_index(drop=True)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Scrape player stats from fbref')
+    arg_parser.add_argument('--backend', choices=['http', 'selenium'], default='http',
+                            help='http uses a pooled keep-alive session and falls back to the browser per page')
+    arg_parser.add_argument('--cache-ttl', type=float, default=12,
+                            help='hours a cached page is reused before it is revalidated')
+    arg_parser.add_argument('--offline', action='store_true',
+                            help='parse purely from cached pages without any network access')
+    arg_parser.add_argument('--leagues', nargs='+', choices=sorted(competitions), default=['premier-league'])
+    arg_parser.add_argument('--seasons', nargs='+', default=['current'],
+                            help='seasons such as 2023-2024, or current')
+    arg_parser.add_argument('--processes', type=int, default=None,
+                            help='run the job scheduler with this many worker processes')
+    arg_parser.add_argument('--min-interval', type=float, default=min_request_interval,
+                            help='seconds between requests to one host across all scheduler workers')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='record only changed player rows and skip rewriting unchanged results')
+    args = arg_parser.parse_args()
+    seasons = [None if season == 'current' else season for season in args.seasons]
+
+    if len(args.leagues) * len(seasons) > 1 or args.processes:
+        df = run_scheduler(args.leagues, seasons, args.backend, args.cache_ttl * 3600,
+                           args.offline, args.processes or os.cpu_count(), args.min_interval)
+    else:
+        cache = ResponseCache(ttl=args.cache_ttl * 3600, offline=args.offline)
+        # Parse each table as soon as its page arrives instead of after the whole batch
+        tables = {}
+        pages = {name: page_url(args.leagues[0], seasons[0], name) for name in page_paths}
+        for name, html in fetch_pages(pages, backend=args.backend, cache=cache):
+            tables[name] = parse_page(name, html)
+        df = join_tables(tables)
+
+
+    df['Minutes'] = pd.to_numeric(
+        df['Minutes'].astype(str).str.replace(',', '', regex=False),
+        errors='coerce'
+    )
+    df = df[df['Minutes'] > 90].sort_values(by='Player').reset_index(drop=True)
+    df = df.replace('', np.nan)
+    df = df.fillna('N/a')
+
+    if args.incremental:
+        summary = SnapshotStore().refresh(df)
+        print(f"Snapshot v{summary['version']}: {summary['added']} added, "
+              f"{summary['changed']} changed, {summary['removed']} removed")
+        if not (summary['added'] or summary['changed'] or summary['removed']):
+            print("No player rows changed, result.csv left untouched")
+            return
+
+    with span('write', rows=len(df)):
+        df.to_csv('Exercise 1/result.csv', na_rep='N/a', index=False)
+        # Typed copy for downstream stages; written after the CSV so it is never older
+        write_player_table(df, RESULT_PARQUET)
+
+    print("Data successfully saved to result.csv and result.parquet")
+
+if __name__ == "__main__":
+    with stage('ex1'):
+        main()
@@ -0,0 +1,153 @@
+import re
+import pandas as pd
+from lxml import etree
+
+from pipeline.instrument import span, count
+
+# Each spec names the fbref table to read and maps the data-stat attribute of
+# every kept column to the name it gets in result.csv, in output order.
+TABLE_SPECS = {
+    'standard': {
+        'table_id': 'stats_standard',
+        'columns': {
+            'player': 'Player', 'nationality': 'Nation', 'position': 'Position', 'team': 'Team',
+            'age': 'Age', 'games': 'Match Played', 'games_starts': 'Starts', 'minutes': 'Minutes',
+            'goals': 'Goals', 'assists': 'Assists', 'cards_yellow': 'Yellow Cards', 'cards_red': 'Red Cards',
+            'xg': 'xG', 'xg_assist': 'xAG', 'progressive_carries': 'PrgC', 'progressive_passes': 'PrgP',
+            'progressive_passes_received': 'PrgR', 'goals_per90': 'Gls/90', 'assists_per90': 'Ast/90',
+            'xg_per90': 'xG/90', 'xg_assist_per90': 'xAG/90'
+        }
+    },
+    'shots': {
+        'table_id': 'stats_shooting',
+        'columns': {
+            'player': 'Player', 'team': 'Team', 'shots_on_target_pct': 'SoT%',
+            'shots_on_target_per90': 'SoT/90', 'goals_per_shot': 'G/Sh', 'average_shot_distance': 'Dist'
+        }
+    },
+    'passes': {
+        'table_id': 'stats_passing',
+        'columns': {
+            'player': 'Player', 'team': 'Team', 'passes_completed': 'Total_Cmp', 'passes_pct': 'Total_Cmp%',
+            'passes_total_distance': 'TotDist', 'passes_pct_short': 'Short_Cmp%',
+            'passes_pct_medium': 'Medium_Cmp%', 'passes_pct_long': 'Long_Cmp%', 'assisted_shots': 'KP',
+            'passes_into_final_third': '1/3', 'passes_into_penalty_area': 'PPA',
+            'crosses_into_penalty_area': 'CrsPA', 'progressive_passes': '(Passing)PrgP'
+        }
+    },
+    'creation': {
+        'table_id': 'stats_gca',
+        'columns': {
+            'player': 'Player', 'team': 'Team', 'sca': 'SCA', 'sca_per90': 'SCA90',
+            'gca': 'GCA', 'gca_per90': 'GCA90'
+        }
+    },
+    'defense': {
+        'table_id': 'stats_defense',
+        'columns': {
+            'player': 'Player', 'team': 'Team', 'tackles': 'Tkl', 'tackles_won': 'TklW',
+            'challenges': 'Att', 'challenges_lost': 'Lost', 'blocks': 'Blocks', 'blocked_shots': 'Sh',
+            'blocked_passes': 'Pass', 'interceptions': 'Int'
+        }
+    },
+    'ball_control': {
+        'table_id': 'stats_possession',
+        'columns': {
+            'player': 'Player', 'team': 'Team', 'touches': 'Touches', 'touches_def_pen_area': 'Def Pen',
+            'touches_def_3rd': 'Def 3rd', 'touches_mid_3rd': 'Mid 3rd', 'touches_att_3rd': 'Att 3rd',
+            'touches_att_pen_area': 'Att Pen', 'take_ons': 'Take-Ons_Att', 'take_ons_won_pct': 'Succ%',
+            'take_ons_tackled_pct': 'Tkld%', 'carries': 'Carries',
+            'carries_progressive_distance': 'PrgDist', 'progressive_carries': 'Carries_PrgC',
+            'carries_into_final_third': 'Carries_1/3', 'carries_into_penalty_area': 'CPA',
+            'miscontrols': 'Mis', 'dispossessed': 'Dis', 'passes_received': 'Rec',
+            'progressive_passes_received': 'Receiving_PrgR'
+        }
+    },
+    'additional': {
+        'table_id': 'stats_misc',
+        'columns': {
+            'player': 'Player', 'team': 'Team', 'fouls': 'Fls', 'fouled': 'Fld', 'offsides': 'Off',
+            'crosses': 'Crs', 'ball_recoveries': 'Recov', 'aerials_won': 'Won',
+            'aerials_lost': '(Misc)Lost', 'aerials_won_pct': 'Won%'
+        }
+    },
+    'keepers': {
+        'table_id': 'stats_keeper',
+        'columns': {
+            'player': 'Player', 'team': 'Team', 'gk_goals_against_per90': 'GA90',
+            'gk_save_pct': 'Save%', 'gk_clean_sheets_pct': 'CS%', 'gk_pens_save_pct': 'Penalty_Save%'
+        }
+    }
+}
+
+
+PLAYER_LINK = re.compile(r'/players/([0-9a-f]+)/')
+
+
+def process_age(age_str):
+    if age_str:
+        return age_str.split('-')[0]
+    return age_str
+
+
+def extract_table_html(html, table_id):
+    """Slice the markup of a single table out of a page, commented out or not"""
+    match = re.search(r'<table[^>]*\bid="%s"' % re.escape(table_id), html)
+    if match is None:
+        raise ValueError(f'Table {table_id} not found in page')
+    end = html.find('</table>', match.end())
+    if end == -1:
+        raise ValueError(f'Table {table_id} is truncated')
+    return html[match.start():end + len('</table>')]
+
+
+def cell_text(cell):
+    # Most cells are plain text; only player/nation cells wrap their value in links
+    if len(cell) == 0:
+        return (cell.text or '').strip()
+    return ''.join(cell.itertext()).strip()
+
+
+def player_id(cell):
+    """Return fbref's stable per-player id, or '' when the row carries none"""
+    if cell.get('data-append-csv'):
+        return cell.get('data-append-csv')
+    for link in cell.iter('a'):
+        match = PLAYER_LINK.search(link.get('href') or '')
+        if match:
+            return match.group(1)
+    return ''
+
+
+def parse_table(html, spec):
+    """Build a DataFrame from one fbref table using its data-stat attributes"""
+    table = etree.fromstring(extract_table_html(html, spec['table_id']), etree.HTMLParser()).find('.//table')
+    stats = list(spec['columns'])
+    columns = {stat: [] for stat in stats}
+    player_ids = []
+
+    for row in table.iterfind('tbody/tr'):
+        # Repeated header rows and spacers carry no player cell
+        if 'thead' in (row.get('class') or ''):
+            continue
+        cells = {cell.get('data-stat'): cell for cell in row}
+        if 'player' not in cells:
+            continue
+        player_ids.append(player_id(cells['player']))
+        for stat in stats:
+            cell = cells.get(stat)
+            columns[stat].append(cell_text(cell) if cell is not None else '')
+
+    frame = pd.DataFrame({spec['columns'][stat]: values for stat, values in columns.items()})
+    frame['Player ID'] = player_ids
+    if 'Age' in frame.columns:
+        frame['Age'] = frame['Age'].map(process_age)
+    return frame
+
+
+def parse_page(name, html):
+    with span('parse', page=name) as current:
+        frame = parse_table(html, TABLE_SPECS[name])
+        current.set(rows=len(frame))
+    count('rows_parsed', len(frame))
+    return frame
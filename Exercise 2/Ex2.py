@@ -1,122 +1,250 @@
 import os
+import sys
+import argparse
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
+import histogram_renderer
 
-def extract_extremes(data, metric):
-    """Retrieve top and bottom performers for a given metric"""
-    clean_data = data[['Player', 'Team', metric]].dropna()
-    top_performers = clean_data.nlargest(3, metric)
-    bottom_performers = clean_data.nsmallest(3, metric)
-    return top_performers, bottom_performers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.player_table import load_player_table, iter_player_table
+from pipeline.feature_store import FeatureStore, source_hash
+from pipeline.snapshot_store import SnapshotStore
+from pipeline.instrument import span, stage, traced
+from online_stats import TeamStatistics
 
+STATE_PATH = 'Exercise 2/team_stats_state.pkl'
 
-def generate_statistical_report(data, numerical_fields):
-    """Generate comprehensive statistical report"""
-    overall_medians = data[numerical_fields].median()
-    overall_means = data[numerical_fields].mean()
-    overall_stds = data[numerical_fields].std()
 
-    team_metrics = data.groupby('Team')[numerical_fields].agg(['median', 'mean', 'std'])
-    team_metrics.columns = [f'{func.capitalize()} of {stat}'
-                            for stat, func in team_metrics.columns]
-    team_metrics = team_metrics.reset_index()
+def middle_value(sorted_values, starts, counts):
+    """Median of each run of sorted, NaN-last values given the run start rows and valid counts"""
+    last = len(sorted_values) - 1
+    lower = np.take_along_axis(sorted_values, np.clip(starts + (counts - 1) // 2, 0, last), axis=0)
+    upper = np.take_along_axis(sorted_values, np.clip(starts + counts // 2, 0, last), axis=0)
+    return np.where(counts > 0, (lower + upper) / 2, np.nan)
+
+
+@traced('aggregate')
+def compute_statistics(data, numerical_fields, team_field='Team', k=3):
+    """Compute overall and per-team moments, medians and top/bottom-k in one pass over the numeric block"""
+    fields = list(numerical_fields)
+    # A private copy, since the data may be a read-only view of the feature store
+    values = data[fields].to_numpy(dtype='float64', na_value=np.nan, copy=True)
+    # Rows without a player or team are ignored, as dropna()/groupby() would do
+    values[data['Player'].isna().to_numpy() | data[team_field].isna().to_numpy()] = np.nan
+    codes, teams = pd.factorize(data[team_field], sort=True)
+
+    # Group rows by team once; every per-team statistic is a reduction over these segments
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    grouped = values[order]
+    group_codes = codes[order]
+    starts = np.searchsorted(group_codes, np.arange(len(teams)))
+    present = ~np.isnan(grouped)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        counts = np.add.reduceat(present, starts, axis=0)
+        means = np.add.reduceat(np.where(present, grouped, 0.0), starts, axis=0) / counts
+        deviations = np.where(present, grouped - means[group_codes], 0.0)
+        stds = np.sqrt(np.add.reduceat(deviations ** 2, starts, axis=0) / (counts - 1))
+        stds[counts < 2] = np.nan
+
+        overall_present = ~np.isnan(values)
+        overall_counts = overall_present.sum(axis=0)
+        overall_means = np.where(overall_present, values, 0.0).sum(axis=0) / overall_counts
+        overall_deviations = np.where(overall_present, values - overall_means, 0.0)
+        overall_stds = np.sqrt((overall_deviations ** 2).sum(axis=0) / (overall_counts - 1))
+        overall_stds[overall_counts < 2] = np.nan
 
-    overall_stats = {'Team': 'All'}
-    for field in numerical_fields:
-        overall_stats[f'Median of {field}'] = overall_medians[field]
-        overall_stats[f'Mean of {field}'] = overall_means[field]
-        overall_stats[f'Std of {field}'] = overall_stds[field]
+    # Sort each column by value once (NaN last, ties in row order as nsmallest keeps them), then
+    # stably regroup by team so every team's values form a sorted run; medians are read off directly
+    value_order = np.argsort(values, axis=0, kind='stable')
+    row_teams = codes[value_order]
+    row_teams[row_teams < 0] = len(teams)
+    by_team = np.take_along_axis(value_order, np.argsort(row_teams, axis=0, kind='stable'), axis=0)
+    team_sorted = np.take_along_axis(values, by_team, axis=0)
+    medians = middle_value(team_sorted, starts[:, None], counts)
+    overall_medians = middle_value(np.take_along_axis(values, value_order, axis=0),
+                                   np.zeros((1, 1), dtype=int), overall_counts[None, :])[0]
 
-    combined_report = pd.concat([
-        pd.DataFrame([overall_stats]),
-        team_metrics
-    ], ignore_index=True)
+    available = np.minimum(overall_counts, k)
+    top_rows = np.argsort(-values, axis=0, kind='stable')[:k]
+    bottom_rows = value_order[:k]
 
-    combined_report['Index'] = range(len(combined_report))
-    stat_columns = [col for col in combined_report.columns
-                    if col not in ['Index', 'Team']]
+    return {
+        'fields': fields,
+        'teams': list(teams),
+        'players': data['Player'].to_numpy(),
+        'row_teams': data[team_field].to_numpy(),
+        'overall': {'median': overall_medians, 'mean': overall_means, 'std': overall_stds},
+        'team': {'median': medians, 'mean': means, 'std': stds},
+        'top': [top_rows[:available[j], j] for j in range(len(fields))],
+        'bottom': [bottom_rows[:available[j], j] for j in range(len(fields))]
+    }
 
-    return combined_report[['Index', 'Team'] + stat_columns]
 
+def extract_extremes(data, stats, metric):
+    """Retrieve top and bottom performers for a given metric as (player, team, value) tuples"""
+    column = stats['fields'].index(metric)
+    players, teams = stats['players'], stats['row_teams']
+    values = data[metric].to_numpy()
+    top_performers = [(players[row], teams[row], values[row]) for row in stats['top'][column]]
+    bottom_performers = [(players[row], teams[row], values[row]) for row in stats['bottom'][column]]
+    return top_performers, bottom_performers
+
+
+def generate_statistical_report(stats):
+    """Generate comprehensive statistical report"""
+    rows = {'Index': np.arange(len(stats['teams']) + 1), 'Team': ['All'] + stats['teams']}
+    for column, field in enumerate(stats['fields']):
+        for func in ('median', 'mean', 'std'):
+            rows[f'{func.capitalize()} of {field}'] = np.concatenate((
+                [stats['overall'][func][column]], stats['team'][func][:, column]))
+    return pd.DataFrame(rows)
 
-def visualize_distributions(data, metrics, team_field='Team'):
+
+@traced('histograms')
+def visualize_distributions(data, metrics, team_field='Team', sheets=False, workers=None):
     """Generate distribution visualizations for specified metrics"""
     if not os.path.exists('Exercise 2/histograms'):
         os.makedirs('Exercise 2/histograms')
 
-    for metric in metrics:
-        # Global distribution
-        data[metric].hist(bins=20)
-        plt.title(f'Distribution of {metric} (All Players)')
-        plt.xlabel(metric)
-        plt.ylabel('Count')
-        plt.savefig(f'Exercise 2/histograms/hist_all_{metric}.png')
-        plt.close()
-
-        # Team-specific distributions
-        for team in data[team_field].unique():
-            team_data = data[data[team_field] == team]
-            team_data[metric].hist(bins=20)
-            plt.title(f'Distribution of {metric} - {team}')
-            plt.xlabel(metric)
-            plt.ylabel('Count')
-            safe_name = team.replace(" ", "_").replace("/", "_")
-            plt.savefig(f'Exercise 2/histograms/hist_{safe_name}_{metric}.png')
-            plt.close()
-
-
-def identify_peak_performers(data, numerical_fields):
+    # Bin counts for every (group, metric) are computed up front from a single groupby
+    values = {metric: data[metric].astype('float64').to_numpy(na_value=np.nan) for metric in metrics}
+    panels = {metric: [(f'Distribution of {metric} (All Players)', 'all',
+                        *histogram_renderer.histogram(values[metric]))] for metric in metrics}
+    for team, rows in data.groupby(team_field, observed=True).indices.items():
+        for metric in metrics:
+            panels[metric].append((f'Distribution of {metric} - {team}',
+                                   str(team).replace(" ", "_").replace("/", "_"),
+                                   *histogram_renderer.histogram(values[metric][rows])))
+
+    if sheets:
+        histogram_renderer.render_sheets([
+            (f'Exercise 2/histograms/hist_sheet_{metric}.png', metric,
+             [(title, counts, edges) for title, _, counts, edges in panels[metric]])
+            for metric in metrics
+        ], workers)
+        return
+
+    histogram_renderer.render_all([
+        (f'Exercise 2/histograms/hist_{name}_{metric}.png', counts, edges, title, metric)
+        for metric in metrics
+        for title, name, counts, edges in panels[metric]
+    ], workers)
+
+
+def identify_peak_performers(stats):
     """Determine teams with highest average for each metric"""
-    team_averages = data.groupby('Team')[numerical_fields].mean()
+    team_averages = stats['team']['mean']
     findings = []
 
-    for field in numerical_fields:
-        peak_value = team_averages[field].max()
-        if pd.notna(peak_value) and peak_value != 0:
-            leading_team = team_averages[field].idxmax()
+    for column, field in enumerate(stats['fields']):
+        if np.isnan(team_averages[:, column]).all():
+            continue
+        leading = np.nanargmax(team_averages[:, column])
+        peak_value = team_averages[leading, column]
+        if peak_value != 0:
             findings.append(
-                f"Metric: {field}, Leading Team: {leading_team}, "
+                f"Metric: {field}, Leading Team: {stats['teams'][leading]}, "
                 f"Average: {peak_value:.2f}"
             )
 
     return findings
 
 
-def main():
-    # Data preparation
-    player_data = pd.read_csv('Exercise 1/result.csv', na_values=['N/a'])
-    player_data.drop(columns=["Age"], inplace=True)
-    player_data.replace("N/a", pd.NA, inplace=True)
-
-    numerical_fields = player_data.select_dtypes(include=['number']).columns
-
-    # Generate top performers report
+def write_top_performers(metrics, extremes):
+    """Write top_3.txt from {metric: (top, bottom)} lists of (player, team, value)"""
     with open('Exercise 2/top_3.txt', 'w', encoding='utf-8') as output_file:
-        for metric in numerical_fields:
-            top, bottom = extract_extremes(player_data, metric)
+        for metric in metrics:
+            top, bottom = extremes[metric]
             output_file.write(f"Metric: {metric}\nTop Performers:\n")
-            for rank, (_, row) in enumerate(top.iterrows(), 1):
-                output_file.write(f" {rank}. {row['Player']} ({row['Team']}): {row[metric]}\n")
+            for rank, (player, team, value) in enumerate(top, 1):
+                output_file.write(f" {rank}. {player} ({team}): {value}\n")
             output_file.write("Lowest Performers:\n")
-            for rank, (_, row) in enumerate(bottom.iterrows(), 1):
-                output_file.write(f" {rank}. {row['Player']} ({row['Team']}): {row[metric]}\n")
+            for rank, (player, team, value) in enumerate(bottom, 1):
+                output_file.write(f" {rank}. {player} ({team}): {value}\n")
             output_file.write("\n")
-    print("Performance analysis saved to top_3.txt")
 
-    # Generate statistical report
-    stats_report = generate_statistical_report(player_data, numerical_fields)
-    stats_report.to_csv('Exercise 2/results2.csv', index=False)
-    print("Statistical report saved to results2.csv")
 
-    # Create visualizations
+@traced('aggregate_streaming')
+def streaming_statistics(refresh=False, state_path=STATE_PATH):
+    """Build TeamStatistics chunk by chunk, or rebuild only the teams touched since the saved state"""
+    chunks = lambda: iter_player_table(['Player', 'Team'], numeric=True, exclude=['Age'])
+    store = SnapshotStore()
+    source = source_hash()
+    stats = None
+    if refresh and os.path.exists(state_path):
+        stats = TeamStatistics.load(state_path)
+        changes = store.changes_since(stats.version)
+        if getattr(stats, 'source_hash', None) != source and changes.empty:
+            # Only Ex1 --incremental records deltas; any other rewrite of the table is invisible to the store
+            print("Player table changed without a recorded snapshot, rebuilding every team")
+            stats = None
+        else:
+            # Row keys end with the team, which also covers players who dropped out
+            touched = set(changes['_key'].str.rsplit('|', n=1).str[1])
+            stats.rebuild_teams(touched, chunks())
+            print(f"Refreshed statistics for {len(touched)} teams")
+    if stats is None:
+        for chunk in chunks():
+            if stats is None:
+                stats = TeamStatistics([c for c in chunk.columns if c not in ('Player', 'Team')])
+            stats.update_frame(chunk)
+    stats.version = store.version
+    stats.source_hash = source
+    stats.save(state_path)
+    return stats
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Statistical report on the Ex1 player table')
+    arg_parser.add_argument('--sheets', action='store_true',
+                            help='draw one multi-panel sheet per metric instead of one PNG per team')
+    arg_parser.add_argument('--workers', type=int, default=None,
+                            help='processes used to render histograms (default: one per core)')
+    arg_parser.add_argument('--streaming', action='store_true',
+                            help='compute the reports from mergeable sketches in bounded memory')
+    arg_parser.add_argument('--refresh', action='store_true',
+                            help='with --streaming, update the saved state only for teams that changed')
+    args = arg_parser.parse_args()
     offensive_metrics = ['Goals', 'Assists', 'xG']
     defensive_metrics = ['Tkl', 'Blocks', 'Int']
-    visualize_distributions(player_data, offensive_metrics + defensive_metrics)
+
+    if args.streaming:
+        team_stats = streaming_statistics(args.refresh)
+        numerical_fields = team_stats.fields
+        extremes = team_stats.extremes()
+        stats_report = team_stats.report()
+        peak_performers = team_stats.peak_performers()
+        # Histograms only need their own columns
+        player_data = load_player_table(['Team'] + offensive_metrics + defensive_metrics)
+    else:
+        # Data preparation (numeric columns are mapped from the shared feature store)
+        with span('load', source='feature_store'):
+            player_data = FeatureStore().open().frame(exclude=['Age'], keys=['Player', 'Team'])
+        numerical_fields = player_data.select_dtypes(include=['number']).columns
+        stats = compute_statistics(player_data, numerical_fields)
+        with span('report'):
+            extremes = {metric: extract_extremes(player_data, stats, metric) for metric in numerical_fields}
+            stats_report = generate_statistical_report(stats)
+            peak_performers = identify_peak_performers(stats)
+
+    with span('write'):
+        # Generate top performers report
+        write_top_performers(numerical_fields, extremes)
+        print("Performance analysis saved to top_3.txt")
+
+        # Generate statistical report
+        stats_report.to_csv('Exercise 2/results2.csv', index=False)
+        print("Statistical report saved to results2.csv")
+
+    # Create visualizations
+    visualize_distributions(player_data, offensive_metrics + defensive_metrics,
+                            sheets=args.sheets, workers=args.workers)
     print("Distribution visualizations saved in 'histograms' directory")
 
     # Identify top-performing teams
-    peak_performers = identify_peak_performers(player_data, numerical_fields)
     with open('Exercise 2/highest_team_stats.txt', 'w') as report_file:
         report_file.write("Teams with Highest Average Performance by Metric\n")
         report_file.write("=" * 50 + "\n\n")
@@ -125,4 +253,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with stage('ex2'):
+        main()
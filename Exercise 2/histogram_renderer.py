@@ -0,0 +1,75 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Figure and axes owned by one worker process, created by init_worker
+worker_figure = {}
+
+
+def init_worker():
+    """Select the non-interactive backend and create the figure this worker reuses"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    worker_figure['figure'], worker_figure['axes'] = plt.subplots()
+
+
+def histogram(values, bins=20):
+    """Bin counts over the range of the non-missing values, as pandas' hist() draws them"""
+    values = values[~np.isnan(values)]
+    return np.histogram(values, bins=bins)
+
+
+def draw_histogram(ax, counts, edges, title, xlabel):
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge')
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel('Count')
+    ax.grid(True)
+
+
+def render_batch(jobs):
+    """Render (path, counts, edges, title, xlabel) jobs on the worker's figure"""
+    figure, ax = worker_figure['figure'], worker_figure['axes']
+    for path, counts, edges, title, xlabel in jobs:
+        ax.clear()
+        draw_histogram(ax, counts, edges, title, xlabel)
+        figure.savefig(path)
+    return len(jobs)
+
+
+def render_sheet(path, metric, panels):
+    """Render every (title, counts, edges) panel of one metric on a single sheet"""
+    import matplotlib.pyplot as plt
+    columns = min(len(panels), 5)
+    rows = math.ceil(len(panels) / columns)
+    figure, axes = plt.subplots(rows, columns, figsize=(4 * columns, 3 * rows), squeeze=False)
+    for ax, (title, counts, edges) in zip(axes.flat, panels):
+        draw_histogram(ax, counts, edges, title, metric)
+    for ax in axes.flat[len(panels):]:
+        ax.set_visible(False)
+    figure.tight_layout()
+    figure.savefig(path)
+    plt.close(figure)
+    return 1
+
+
+def render_all(jobs, workers=None, batch_size=16):
+    """Render independent histogram jobs in a pool of Agg worker processes"""
+    if not jobs:
+        return 0
+    workers = workers or min(os.cpu_count() or 1, math.ceil(len(jobs) / batch_size))
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        return sum(pool.map(render_batch, batches))
+
+
+def render_sheets(sheets, workers=None):
+    """Render one multi-panel sheet per metric in a pool of Agg worker processes"""
+    if not sheets:
+        return 0
+    workers = workers or min(os.cpu_count() or 1, len(sheets))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        return sum(pool.map(render_sheet, *zip(*sheets)))
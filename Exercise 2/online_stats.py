@@ -0,0 +1,281 @@
+import bisect
+import math
+import pickle
+import random
+
+import numpy as np
+import pandas as pd
+
+
+class RunningMoments:
+    """Count, mean and variance updated with Welford's method and merged with Chan's formula"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def update_many(self, values):
+        """Fold a batch in by merging its exact moments, which is cheaper than looping"""
+        values = values[~np.isnan(values)]
+        if len(values):
+            batch = RunningMoments()
+            batch.count = len(values)
+            batch.mean = float(values.mean())
+            batch.m2 = float(((values - batch.mean) ** 2).sum())
+            self.merge(batch)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        return self
+
+    def std(self):
+        """Sample standard deviation (ddof=1), NaN below two observations like pandas"""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def average(self):
+        return self.mean if self.count else np.nan
+
+
+class KLLSketch:
+    """Mergeable quantile sketch (Karnin, Lang and Liberty) with bounded memory
+
+    Items live in a stack of compactors; compactor h holds items of weight 2**h.
+    While nothing has been compacted the sketch still holds every value and the
+    median it reports is exact.
+    """
+
+    def __init__(self, k=200, c=2 / 3, seed=None):
+        self.k = k
+        self.c = c
+        self.rng = random.Random(seed)
+        self.compactors = [[]]
+        self.size = 0
+        self.max_size = self._capacity(0)
+
+    def _capacity(self, height):
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.c ** depth * self.k)) + 1
+
+    def _grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(height) for height in range(len(self.compactors)))
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.size += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def update_many(self, values):
+        for value in values[~np.isnan(values)].tolist():
+            self.update(value)
+
+    def _compress(self):
+        for height in range(len(self.compactors)):
+            if len(self.compactors[height]) >= self._capacity(height):
+                if height + 1 >= len(self.compactors):
+                    self._grow()
+                items = sorted(self.compactors[height])
+                # Keep a leftover item at this level when the count is odd
+                leftover = [items.pop()] if len(items) % 2 else []
+                offset = 1 if self.rng.random() < 0.5 else 0
+                self.compactors[height + 1].extend(items[offset::2])
+                self.compactors[height] = leftover
+                self.size = sum(len(compactor) for compactor in self.compactors)
+                if self.size < self.max_size:
+                    break
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for height, compactor in enumerate(other.compactors):
+            self.compactors[height].extend(compactor)
+        self.size = sum(len(compactor) for compactor in self.compactors)
+        while self.size >= self.max_size:
+            self._compress()
+        return self
+
+    @property
+    def exact(self):
+        return all(not compactor for compactor in self.compactors[1:])
+
+    def quantile(self, q):
+        if self.size == 0:
+            return np.nan
+        if self.exact:
+            return float(np.quantile(self.compactors[0], q))
+        weighted = sorted((value, 2 ** height)
+                          for height, compactor in enumerate(self.compactors) for value in compactor)
+        values = np.array([value for value, _ in weighted])
+        cumulative = np.cumsum([weight for _, weight in weighted])
+        return float(values[np.searchsorted(cumulative, q * cumulative[-1])])
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+class TopK:
+    """Bounded list of the k best (sort_key, payload) entries seen so far"""
+
+    def __init__(self, k=3):
+        self.k = k
+        self.items = []
+
+    def push(self, key, payload):
+        if len(self.items) < self.k or key < self.items[-1][0]:
+            bisect.insort(self.items, (key, payload), key=lambda item: item[0])
+            del self.items[self.k:]
+
+    def merge(self, other):
+        for key, payload in other.items:
+            self.push(key, payload)
+        return self
+
+
+class TeamState:
+    """Mergeable state of one team: moments, a quantile sketch and top/bottom-k per metric"""
+
+    def __init__(self, fields, k=3, sketch_size=200):
+        self.k = k
+        self.moments = {field: RunningMoments() for field in fields}
+        self.sketches = {field: KLLSketch(sketch_size) for field in fields}
+        self.top = {field: TopK(k) for field in fields}
+        self.bottom = {field: TopK(k) for field in fields}
+
+    def update_frame(self, frame, fields, player_field='Player', team_field='Team'):
+        players = frame[player_field].to_numpy()
+        teams = frame[team_field].to_numpy()
+        for field in fields:
+            raw = frame[field].to_numpy()
+            values = frame[field].astype('float64').to_numpy(na_value=np.nan)
+            self.moments[field].update_many(values)
+            self.sketches[field].update_many(values)
+            valid = values[~np.isnan(values)]
+            if not len(valid):
+                continue
+            # Only rows at least as extreme as the chunk's k-th value can enter the lists
+            ranked = np.sort(valid)
+            low, high = ranked[min(self.k, len(ranked)) - 1], ranked[-min(self.k, len(ranked))]
+            # Ties go to the alphabetically first player, which is result.csv's row order
+            for row in np.flatnonzero(values >= high):
+                self.top[field].push((-values[row], str(players[row]), str(teams[row])),
+                                     (players[row], teams[row], raw[row]))
+            for row in np.flatnonzero(values <= low):
+                self.bottom[field].push((values[row], str(players[row]), str(teams[row])),
+                                        (players[row], teams[row], raw[row]))
+
+    def merge(self, other):
+        for field in self.moments:
+            self.moments[field].merge(other.moments[field])
+            self.sketches[field].merge(other.sketches[field])
+            self.top[field].merge(other.top[field])
+            self.bottom[field].merge(other.bottom[field])
+        return self
+
+
+class TeamStatistics:
+    """Per-(team, metric) streaming statistics for Ex2's reports
+
+    Rows can be fed in chunks of any size, states of separately processed
+    partitions can be merged, and single teams can be rebuilt after a refresh.
+    The overall ('All') statistics are always derived by merging team states.
+    """
+
+    def __init__(self, fields, k=3, sketch_size=200):
+        self.fields = list(fields)
+        self.k = k
+        self.sketch_size = sketch_size
+        self.teams = {}
+        self.version = 0
+        # Hash of the player table the state was last built from
+        self.source_hash = None
+
+    def _new_state(self):
+        return TeamState(self.fields, self.k, self.sketch_size)
+
+    def update_frame(self, frame, team_field='Team'):
+        frame = frame.dropna(subset=['Player', team_field])
+        for team, rows in frame.groupby(team_field, observed=True).indices.items():
+            state = self.teams.setdefault(str(team), self._new_state())
+            state.update_frame(frame.iloc[rows], self.fields, team_field=team_field)
+        return self
+
+    def merge(self, other):
+        for team, state in other.teams.items():
+            if team in self.teams:
+                self.teams[team].merge(state)
+            else:
+                self.teams[team] = state
+        self.version = max(self.version, other.version)
+        return self
+
+    def rebuild_teams(self, teams, frames, team_field='Team'):
+        """Replace the state of the given teams with one rebuilt from their current rows"""
+        teams = {str(team) for team in teams}
+        for team in teams:
+            self.teams.pop(team, None)
+        for frame in frames:
+            self.update_frame(frame[frame[team_field].astype(str).isin(teams)], team_field)
+        return self
+
+    def overall(self):
+        state = self._new_state()
+        for team_state in self.teams.values():
+            state.merge(team_state)
+        return state
+
+    def report(self):
+        """Build the results2.csv table: overall row first, then teams alphabetically"""
+        names = sorted(self.teams)
+        states = [self.overall()] + [self.teams[name] for name in names]
+        rows = {'Index': np.arange(len(states)), 'Team': ['All'] + names}
+        for field in self.fields:
+            rows[f'Median of {field}'] = [state.sketches[field].median() for state in states]
+            rows[f'Mean of {field}'] = [state.moments[field].average() for state in states]
+            rows[f'Std of {field}'] = [state.moments[field].std() for state in states]
+        return pd.DataFrame(rows)
+
+    def extremes(self, overall=None):
+        """Return {metric: (top, bottom)} lists of (player, team, value) over all teams"""
+        overall = overall or self.overall()
+        return {field: ([payload for _, payload in overall.top[field].items],
+                        [payload for _, payload in overall.bottom[field].items])
+                for field in self.fields}
+
+    def peak_performers(self):
+        """Determine teams with highest average for each metric"""
+        names = sorted(self.teams)
+        findings = []
+        for field in self.fields:
+            averages = np.array([self.teams[name].moments[field].average() for name in names])
+            if np.isnan(averages).all():
+                continue
+            leading = np.nanargmax(averages)
+            if averages[leading] != 0:
+                findings.append(
+                    f"Metric: {field}, Leading Team: {names[leading]}, "
+                    f"Average: {averages[leading]:.2f}"
+                )
+        return findings
+
+    def save(self, path):
+        with open(path, 'wb') as handle:
+            pickle.dump(self, handle)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as handle:
+            return pickle.load(handle)
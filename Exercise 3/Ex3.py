@@ -1,42 +1,112 @@
-import pandas as pd
+import os
+import sys
+import argparse
+import numpy as np
 import matplotlib.pyplot as plt
+from joblib import Parallel, delayed
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.decomposition import PCA
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.feature_store import FeatureStore
+from pipeline.instrument import span, stage, traced
+from cluster_quality import best_k, score_sweep, silhouette
+from cluster_model import ClusterModel, DEFAULT_DRIFT_THRESHOLD
+from similarity import SimilarityIndex
 
-def prepare_data(filepath, excluded_columns):
-    """Load and preprocess the dataset"""
-    dataset = pd.read_csv(filepath, na_values=['N/a'])
-    processed_data = dataset.drop(columns=excluded_columns)
-    return processed_data.fillna(processed_data.mean(numeric_only=True))
+# Above this many rows the automatic mode switches from full KMeans to MiniBatchKMeans
+MINIBATCH_THRESHOLD = 20000
+# Above this many rows silhouette is estimated from a stratified sample instead of computed exactly
+SILHOUETTE_EXACT_LIMIT = 5000
 
 
-def determine_optimal_clusters(data, max_clusters=10):
-    """Calculate WCSS for different cluster counts"""
-    scaler = StandardScaler()
-    normalized_data = scaler.fit_transform(data)
+def prepare_data(excluded_columns, features=None):
+    """Load the mean-imputed numeric columns from the shared feature store"""
+    features = features or FeatureStore().open()
+    return features.frame(exclude=excluded_columns, kind='imputed')
 
-    cluster_errors = []
-    for n in range(1, max_clusters + 1):
-        cluster_model = KMeans(
-            n_clusters=n,
-            init='k-means++',
+
+def build_model(n_clusters, mode='full', init='k-means++'):
+    """Create the clustering estimator used for one k of the sweep"""
+    if mode == 'minibatch':
+        return MiniBatchKMeans(
+            n_clusters=n_clusters,
+            init=init,
             max_iter=400,
-            n_init=20,
+            batch_size=4096,
+            n_init=3,
             random_state=42
         )
-        cluster_model.fit(normalized_data)
-        cluster_errors.append(cluster_model.inertia_)
+    return KMeans(
+        n_clusters=n_clusters,
+        init=init,
+        max_iter=400,
+        n_init=20 if mode == 'full' else 1,
+        random_state=42
+    )
+
+
+def fit_model(data, n_clusters, mode):
+    with span('kmeans_fit', k=n_clusters, mode=mode, rows=len(data)):
+        return build_model(n_clusters, mode).fit(data)
+
+
+def warm_started_sweep(data, max_clusters):
+    """Fit k = 1..max_clusters, seeding each k with the previous centroids plus the farthest point"""
+    models = []
+    centers = data.mean(axis=0, keepdims=True)
+    for n in range(1, max_clusters + 1):
+        with span('kmeans_fit', k=n, mode='warm', rows=len(data)):
+            model = build_model(n, 'warm', init=centers).fit(data)
+        models.append(model)
+        # n x k distances; the farthest point from every centroid seeds the next k
+        distances = model.transform(data).min(axis=1)
+        centers = np.vstack([model.cluster_centers_, data[np.argmax(distances)]])
+    return models
+
+
+def choose_mode(n_samples, mode='auto'):
+    if mode != 'auto':
+        return mode
+    return 'minibatch' if n_samples > MINIBATCH_THRESHOLD else 'full'
+
+
+@traced('cluster_sweep')
+def determine_optimal_clusters(data, max_clusters=10, mode='auto', n_jobs=-1, prescaled=None):
+    """Calculate WCSS for different cluster counts, fitting the sweep in parallel
+
+    Returns the scaled data, the WCSS values, the fitted model for every k (so
+    the final clustering can reuse its model instead of refitting it) and the
+    fitted scaler. prescaled is an optional (scaled matrix, fitted scaler) pair,
+    e.g. from the feature store, that replaces the scaling pass.
+    """
+    if prescaled is not None:
+        normalized_data, scaler = prescaled
+    else:
+        scaler = StandardScaler()
+        normalized_data = scaler.fit_transform(data)
+    mode = choose_mode(len(normalized_data), mode)
+
+    if mode == 'warm':
+        fitted = warm_started_sweep(normalized_data, max_clusters)
+    else:
+        fitted = Parallel(n_jobs=n_jobs)(
+            delayed(fit_model)(normalized_data, n, mode) for n in range(1, max_clusters + 1)
+        )
 
-    return normalized_data, cluster_errors
+    models = {model.n_clusters: model for model in fitted}
+    cluster_errors = [models[n].inertia_ for n in range(1, max_clusters + 1)]
+    return normalized_data, cluster_errors, models, scaler
 
 
-def visualize_elbow_method(cluster_range, wcss_values):
-    """Plot the elbow method graph"""
+def visualize_elbow_method(cluster_range, wcss_values, chosen_k=None):
+    """Plot the elbow method graph, marking the automatically chosen cluster count"""
     plt.figure()
     plt.plot(cluster_range, wcss_values, marker='o')
+    if chosen_k is not None:
+        plt.axvline(chosen_k, color='tab:red', linestyle='--', label=f'Selected k = {chosen_k}')
+        plt.legend()
     plt.title("Optimal Cluster Count Determination")
     plt.xlabel("Number of Clusters")
     plt.ylabel("Within-Cluster Sum of Squares")
@@ -45,15 +115,12 @@ def visualize_elbow_method(cluster_range, wcss_values):
     plt.close()
 
 
-def perform_clustering(data, n_clusters=3):
-    """Execute K-means clustering and return results"""
-    clustering_model = KMeans(
-        n_clusters=n_clusters,
-        init='k-means++',
-        max_iter=400,
-        n_init=20,
-        random_state=42
-    )
+def perform_clustering(data, n_clusters=3, models=None, mode='full'):
+    """Execute K-means clustering and return results, reusing a model from the sweep when given"""
+    if models and n_clusters in models:
+        clustering_model = models[n_clusters]
+        return clustering_model.predict(data), clustering_model
+    clustering_model = build_model(n_clusters, mode)
     cluster_labels = clustering_model.fit_predict(data)
     return cluster_labels, clustering_model
 
@@ -78,32 +145,137 @@ def visualize_clusters(features_2d, cluster_labels):
 
 
 def main():
+    arg_parser = argparse.ArgumentParser(description='Cluster players on their Ex1 statistics')
+    arg_parser.add_argument('--mode', choices=['auto', 'full', 'minibatch', 'warm'], default='auto',
+                            help='full KMeans, MiniBatchKMeans, or a sequential warm-started sweep; '
+                                 f'auto picks minibatch above {MINIBATCH_THRESHOLD} players')
+    arg_parser.add_argument('--jobs', type=int, default=-1, help='parallel fits in the k-sweep (-1: all cores)')
+    arg_parser.add_argument('--max-clusters', type=int, default=10)
+    arg_parser.add_argument('--clusters', type=int, default=None,
+                            help='number of clusters for the final model (default: best k of the sweep)')
+    arg_parser.add_argument('--criterion', choices=['silhouette', 'calinski_harabasz', 'davies_bouldin'],
+                            default='silhouette', help='score used to pick the best k')
+    arg_parser.add_argument('--refit', action='store_true', help='ignore the saved model and refit everything')
+    arg_parser.add_argument('--drift-threshold', type=float, default=DEFAULT_DRIFT_THRESHOLD,
+                            help='refit changed input once the mean centroid distance grows by this fraction')
+    arg_parser.add_argument('--assign', nargs='+', metavar='PLAYER',
+                            help='only classify these players with the saved model and print the result')
+    arg_parser.add_argument('--similar', nargs='+', metavar='PLAYER',
+                            help='print the players most similar to these players, using the saved model')
+    arg_parser.add_argument('--top', type=int, default=10, help='neighbours listed per player for --similar')
+    arg_parser.add_argument('--position', nargs='+', metavar='CODE',
+                            help='restrict --similar results to these positions, e.g. MF FW')
+    arg_parser.add_argument('--silhouette-sample', type=int, default=None,
+                            help=f'estimate silhouette from this many sampled players '
+                                 f'(default: exact up to {SILHOUETTE_EXACT_LIMIT} players, 2000 above)')
+    args = arg_parser.parse_args()
+
     # Configuration
-    INPUT_FILE = 'Exercise 1/result.csv'
-    COLUMNS_TO_REMOVE = [
-        'Player', 'Nation', 'Position', 'Team',
-        'GA90', 'Save%', 'CS%', 'Penalty_Save%'
-    ]
-
-    # Data preparation
-    analysis_data = prepare_data(INPUT_FILE, COLUMNS_TO_REMOVE)
-
-    # Cluster optimization
-    scaled_data, wcss_values = determine_optimal_clusters(analysis_data)
-    visualize_elbow_method(range(1, 11), wcss_values)
+    COLUMNS_TO_REMOVE = ['GA90', 'Save%', 'CS%', 'Penalty_Save%']
+
+    if args.assign:
+        assign_players(args.assign)
+        return
+    if args.similar:
+        similar_players(args.similar, args.top, args.position)
+        return
+
+    # Data preparation (imputed and scaled once per snapshot by the feature store)
+    features = FeatureStore().open()
+    analysis_data = prepare_data(COLUMNS_TO_REMOVE, features)
+
+    sample_size = args.silhouette_sample
+    if sample_size is None and len(analysis_data) > SILHOUETTE_EXACT_LIMIT:
+        sample_size = 2000
+
+    # A saved model is reused while its input is unchanged or has drifted too little
+    cluster_model = None if args.refit else ClusterModel.load()
+    if cluster_model is not None:
+        settings = {'criterion': args.criterion, 'mode': args.mode, 'max_clusters': args.max_clusters,
+                    'clusters': args.clusters}
+        refit, reason = cluster_model.needs_refit(analysis_data, args.drift_threshold, settings)
+        print(f"Saved cluster model: {reason}")
+        if refit:
+            cluster_model = None
+
+    if cluster_model is None:
+        prescaled = (features.scaled_matrix(exclude=COLUMNS_TO_REMOVE), features.scaler(exclude=COLUMNS_TO_REMOVE))
+        cluster_model = fit_cluster_model(analysis_data, args, sample_size, prescaled)
+        cluster_model.save()
+        print("Cluster model saved to model/cluster_model.npz")
+
+    # Assignment and visualization straight from the persisted model
+    n_clusters = cluster_model.n_clusters
+    visualize_elbow_method(range(1, len(cluster_model.info['wcss']) + 1), cluster_model.info['wcss'], n_clusters)
     print("Elbow analysis plot saved to elbow_analysis.png")
 
-    # Clustering execution
-    cluster_assignments, model = perform_clustering(scaled_data)
-    clustering_score = silhouette_score(scaled_data, cluster_assignments)
-    print(f"Clustering Quality Score: {clustering_score:.3f}")
+    cluster_assignments, reduced_features, scaled_data = cluster_model.assign(analysis_data)
+    with span('silhouette', sample_size=sample_size):
+        clustering_score, low, high = silhouette(scaled_data, cluster_assignments, sample_size)
+    if sample_size is None:
+        print(f"Clustering Quality Score: {clustering_score:.3f}")
+    else:
+        print(f"Clustering Quality Score: {clustering_score:.3f} (95% CI {low:.3f} to {high:.3f})")
 
-    # Dimensionality reduction and visualization
-    reducer = PCA(n_components=2)
-    reduced_features = reducer.fit_transform(scaled_data)
     visualize_clusters(reduced_features, cluster_assignments)
     print("Cluster visualization saved to cluster_visualization_2d.png")
 
 
+def fit_cluster_model(analysis_data, args, sample_size, prescaled=None):
+    """Run the k-sweep, pick k, and reduce scaler, centroids and PCA to a ClusterModel"""
+    scaled_data, wcss_values, models, scaler = determine_optimal_clusters(
+        analysis_data, args.max_clusters, args.mode, args.jobs, prescaled)
+    with span('score_sweep', sample_size=sample_size):
+        sweep_scores = score_sweep(scaled_data, models, sample_size)
+    print(sweep_scores.to_string(index=False, float_format='{:.3f}'.format))
+    n_clusters = args.clusters or best_k(sweep_scores, args.criterion)
+    print(f"Selected cluster count: {n_clusters}")
+
+    # Clustering execution (the sweep already fitted this k)
+    _, model = perform_clustering(scaled_data, n_clusters, models, choose_mode(len(scaled_data), args.mode))
+
+    # Dimensionality reduction
+    with span('pca_fit'):
+        reducer = PCA(n_components=2)
+        reducer.fit(scaled_data)
+    return ClusterModel.from_fitted(analysis_data, scaler, model, reducer,
+                                    info={'wcss': [float(value) for value in wcss_values],
+                                          'criterion': args.criterion, 'mode': args.mode,
+                                          'clusters': args.clusters})
+
+
+def load_saved_model():
+    cluster_model = ClusterModel.load()
+    if cluster_model is None:
+        sys.exit("No saved cluster model; run Ex3.py once without --assign/--similar first")
+    return cluster_model
+
+
+def assign_players(names):
+    """Classify the named players with the saved model, without refitting anything"""
+    cluster_model = load_saved_model()
+    players = FeatureStore().open().frame(cluster_model.columns, keys=['Player'])
+    players = players[players['Player'].isin(names)]
+    missing = sorted(set(names) - set(players['Player']))
+    if missing:
+        print(f"Not in the player table: {', '.join(missing)}")
+    labels, coordinates, _ = cluster_model.assign(players)
+    for name, label, (x, y) in zip(players['Player'], labels, coordinates):
+        print(f"{name}: cluster {label} at ({x:.3f}, {y:.3f})")
+
+
+def similar_players(names, top=10, positions=None):
+    """Print the nearest players to each named player in the saved model's feature space"""
+    cluster_model = load_saved_model()
+    players = FeatureStore().open().frame(cluster_model.columns, keys=['Player', 'Position'])
+    index = SimilarityIndex.from_cluster_model(cluster_model, players)
+    try:
+        matches = index.most_similar(names, top, positions)
+    except KeyError as error:
+        sys.exit(error.args[0])
+    print(matches.to_string(index=False, float_format='{:.3f}'.format))
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with stage('ex3'):
+        main()
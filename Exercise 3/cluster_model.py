@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+# Refit once the mean distance to the nearest centroid grows by more than this fraction
+DEFAULT_DRIFT_THRESHOLD = 0.10
+
+
+def feature_hash(data):
+    """Hash of the feature columns and values, used to tell whether a saved model is stale"""
+    digest = hashlib.sha256('\x1f'.join(map(str, data.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ClusterModel:
+    """Fitted scaler, centroids and PCA projection reduced to plain numpy arrays
+
+    assign() only does the arithmetic of StandardScaler.transform,
+    KMeans.predict and PCA.transform, so classifying a few new players needs no
+    sklearn objects and no refit.
+    """
+
+    ARRAYS = ['fill_values', 'mean', 'scale', 'centroids', 'pca_mean', 'pca_components']
+
+    def __init__(self, columns, fill_values, mean, scale, centroids, pca_mean, pca_components,
+                 info=None):
+        self.columns = list(columns)
+        self.fill_values = np.asarray(fill_values, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.pca_mean = np.asarray(pca_mean, dtype=np.float64)
+        self.pca_components = np.asarray(pca_components, dtype=np.float64)
+        self.info = dict(info or {})
+        self._centroid_norms = (self.centroids ** 2).sum(axis=1)
+
+    @classmethod
+    def from_fitted(cls, data, scaler, clustering_model, reducer, info=None):
+        """Build the model from the frame Ex3 clustered and its fitted sklearn estimators"""
+        model = cls(data.columns, data.mean(numeric_only=True).to_numpy(), scaler.mean_, scaler.scale_,
+                    clustering_model.cluster_centers_, reducer.mean_, reducer.components_, info)
+        distances = model.distances(data)
+        model.info.update(input_hash=feature_hash(data), n_samples=len(data),
+                          n_clusters=len(model.centroids), mean_distance=float(distances.mean()),
+                          fitted_at=time.time())
+        return model
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    def transform(self, data):
+        """Impute with the training means and standardize with the training scaler"""
+        if isinstance(data, pd.DataFrame):
+            data = data[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        values = np.atleast_2d(np.asarray(data, dtype=np.float64))
+        values = np.where(np.isnan(values), self.fill_values, values)
+        return (values - self.mean) / self.scale
+
+    def _squared_distances(self, scaled):
+        return np.maximum((scaled ** 2).sum(axis=1)[:, None] - 2 * scaled @ self.centroids.T
+                          + self._centroid_norms[None, :], 0)
+
+    def distances(self, data):
+        """Euclidean distance of every row to its nearest centroid"""
+        return np.sqrt(self._squared_distances(self.transform(data)).min(axis=1))
+
+    def assign(self, data):
+        """Return (cluster labels, 2-D PCA coordinates, scaled features) for new or updated rows"""
+        scaled = self.transform(data)
+        labels = self._squared_distances(scaled).argmin(axis=1)
+        coordinates = (scaled - self.pca_mean) @ self.pca_components.T
+        return labels, coordinates, scaled
+
+    def drift(self, data):
+        """Relative growth of the mean nearest-centroid distance since the model was fitted"""
+        if list(data.columns) != self.columns:
+            return np.inf
+        reference = self.info.get('mean_distance')
+        if not reference:
+            return np.inf
+        return float(self.distances(data).mean() / reference - 1)
+
+    def fitted_settings(self):
+        """The sweep settings the model was fitted with: criterion, mode, max_clusters and the forced k
+
+        clusters is None when k was picked by the criterion, so a forced k
+        and an automatic one never stand in for each other.
+        """
+        return {'criterion': self.info.get('criterion'), 'mode': self.info.get('mode'),
+                'max_clusters': len(self.info.get('wcss', [])), 'clusters': self.info.get('clusters')}
+
+    def needs_refit(self, data, threshold=DEFAULT_DRIFT_THRESHOLD, settings=None):
+        """Return (refit?, reason)
+
+        A model fitted with other sweep settings always refits; otherwise
+        unchanged input never refits and changed input refits past the drift
+        threshold.
+        """
+        fitted = self.fitted_settings()
+        changed = [name for name, value in (settings or {}).items() if fitted.get(name) != value]
+        if changed:
+            return True, f"fitted with different {', '.join(changed)}"
+        if feature_hash(data) == self.info.get('input_hash'):
+            return False, 'input unchanged'
+        drift = self.drift(data)
+        if drift > threshold:
+            return True, f'drift {drift:.3f} above {threshold:.3f}'
+        return False, f'drift {drift:.3f} within {threshold:.3f}'
+
+    def save(self, model_dir=MODEL_DIR):
+        os.makedirs(model_dir, exist_ok=True)
+        arrays_path = os.path.join(model_dir, 'cluster_model.npz')
+        with open(arrays_path + '.tmp', 'wb') as handle:
+            np.savez(handle, **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(arrays_path + '.tmp', arrays_path)
+        # Metadata is written last, so a stale json never describes newer arrays
+        meta_path = os.path.join(model_dir, 'cluster_model.json')
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump({'columns': self.columns, 'info': self.info}, handle, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    @classmethod
+    def load(cls, model_dir=MODEL_DIR):
+        """Return the saved model, or None when there is none yet"""
+        meta_path = os.path.join(model_dir, 'cluster_model.json')
+        arrays_path = os.path.join(model_dir, 'cluster_model.npz')
+        if not (os.path.exists(meta_path) and os.path.exists(arrays_path)):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as handle:
+            meta = json.load(handle)
+        with np.load(arrays_path) as arrays:
+            return cls(meta['columns'], *(arrays[name] for name in cls.ARRAYS), info=meta['info'])
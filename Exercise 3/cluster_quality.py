@@ -0,0 +1,138 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score
+
+# Rows of the distance block computed at once; a block holds chunk_rows x n_samples floats
+DEFAULT_CHUNK_ROWS = 512
+
+
+def _cluster_indicator(labels):
+    """Return (cluster ids, label codes, one-hot matrix, cluster sizes) for a label vector"""
+    clusters, codes = np.unique(labels, return_inverse=True)
+    indicator = np.zeros((len(labels), len(clusters)))
+    indicator[np.arange(len(labels)), codes] = 1.0
+    return clusters, codes, indicator, indicator.sum(axis=0)
+
+
+def silhouette_values(data, labels, rows=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Silhouette of the given rows (all rows by default) measured against the full data
+
+    Distances are computed block by block, so memory stays at chunk_rows x
+    n_samples no matter how many rows are scored.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    rows = np.arange(len(data)) if rows is None else np.asarray(rows)
+    _, codes, indicator, sizes = _cluster_indicator(labels)
+    squared_norms = (data ** 2).sum(axis=1)
+
+    scores = np.empty(len(rows))
+    for start in range(0, len(rows), chunk_rows):
+        block = rows[start:start + chunk_rows]
+        squared = squared_norms[block, None] - 2 * data[block] @ data.T + squared_norms[None, :]
+        distances = np.sqrt(np.maximum(squared, 0))
+        distances[np.arange(len(block)), block] = 0
+        # Sum of distances from every row of the block to every cluster
+        sums = distances @ indicator
+        own = codes[block]
+        own_sizes = sizes[own] - 1
+        within = np.divide(sums[np.arange(len(block)), own], own_sizes,
+                           out=np.zeros(len(block)), where=own_sizes > 0)
+        means = sums / sizes
+        means[np.arange(len(block)), own] = np.inf
+        nearest = means.min(axis=1)
+        block_scores = (nearest - within) / np.maximum(within, nearest)
+        # Points alone in their cluster score 0, as in sklearn
+        block_scores[own_sizes == 0] = 0
+        scores[start:start + chunk_rows] = block_scores
+    return scores
+
+
+def chunked_silhouette(data, labels, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Exact mean silhouette computed in memory-bounded blocks"""
+    return float(silhouette_values(data, labels, chunk_rows=chunk_rows).mean())
+
+
+def stratified_sample(labels, sample_size, seed=42):
+    """Draw about sample_size rows with each cluster represented in proportion to its size"""
+    rng = np.random.default_rng(seed)
+    clusters, codes = np.unique(labels, return_inverse=True)
+    rows = []
+    for cluster in range(len(clusters)):
+        members = np.flatnonzero(codes == cluster)
+        take = max(1, round(sample_size * len(members) / len(labels)))
+        rows.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    return np.sort(np.concatenate(rows))
+
+
+def sampled_silhouette(data, labels, sample_size=2000, confidence=0.95, seed=42,
+                       chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Estimate the mean silhouette from a stratified sample of rows
+
+    Each sampled row is scored against the full data, so the estimate is
+    unbiased; the interval is the stratified normal approximation. Returns
+    (estimate, low, high); small inputs are scored exactly with a zero-width
+    interval.
+    """
+    labels = np.asarray(labels)
+    if sample_size >= len(labels):
+        score = chunked_silhouette(data, labels, chunk_rows)
+        return score, score, score
+
+    rows = stratified_sample(labels, sample_size, seed)
+    values = silhouette_values(data, labels, rows, chunk_rows)
+    sampled_labels = labels[rows]
+
+    estimate, variance = 0.0, 0.0
+    for cluster in np.unique(labels):
+        weight = np.mean(labels == cluster)
+        stratum = values[sampled_labels == cluster]
+        estimate += weight * stratum.mean()
+        population = np.sum(labels == cluster)
+        if len(stratum) > 1:
+            correction = 1 - len(stratum) / population
+            variance += weight ** 2 * stratum.var(ddof=1) / len(stratum) * correction
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    margin = z * math.sqrt(variance)
+    return float(estimate), float(estimate - margin), float(estimate + margin)
+
+
+def silhouette(data, labels, sample_size=None, seed=42, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Return (score, low, high): exact when sample_size is None, else a sampled estimate"""
+    if sample_size is None:
+        score = chunked_silhouette(data, labels, chunk_rows)
+        return score, score, score
+    return sampled_silhouette(data, labels, sample_size, seed=seed, chunk_rows=chunk_rows)
+
+
+def score_sweep(data, models, sample_size=None, seed=42):
+    """Score every model of a k-sweep with WCSS, Calinski-Harabasz, Davies-Bouldin and silhouette
+
+    models maps k to a fitted estimator; k=1 only gets its WCSS since the
+    other criteria need at least two clusters.
+    """
+    rows = []
+    for k in sorted(models):
+        model = models[k]
+        labels = model.labels_
+        row = {'k': k, 'wcss': model.inertia_, 'calinski_harabasz': np.nan, 'davies_bouldin': np.nan,
+               'silhouette': np.nan, 'silhouette_low': np.nan, 'silhouette_high': np.nan}
+        if len(np.unique(labels)) > 1:
+            row['calinski_harabasz'] = calinski_harabasz_score(data, labels)
+            row['davies_bouldin'] = davies_bouldin_score(data, labels)
+            row['silhouette'], row['silhouette_low'], row['silhouette_high'] = silhouette(
+                data, labels, sample_size, seed)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def best_k(scores, criterion='silhouette'):
+    """Pick k from a score_sweep table: highest silhouette or Calinski-Harabasz, lowest Davies-Bouldin"""
+    valid = scores.dropna(subset=[criterion])
+    if valid.empty:
+        return int(scores['k'].iloc[0])
+    position = valid[criterion].idxmin() if criterion == 'davies_bouldin' else valid[criterion].idxmax()
+    return int(valid.loc[position, 'k'])
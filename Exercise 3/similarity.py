@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# Index rows scored per block; a block holds n_queries x block_rows float32 distances
+DEFAULT_BLOCK_ROWS = 8192
+
+
+def position_codes(position):
+    """Split an fbref position such as 'DF,MF' into its codes"""
+    if not isinstance(position, str):
+        return set()
+    return {code.strip() for code in position.split(',') if code.strip()}
+
+
+class SimilarityIndex:
+    """Nearest-neighbour search over standardized player features
+
+    With ~70 dimensions tree indexes degrade to a linear scan, so the index is
+    a contiguous float32 matrix searched by blocked brute force: each block is
+    one matrix product for the whole batch of queries, and only the running
+    top-k per query is kept between blocks.
+    """
+
+    def __init__(self, features, players, positions=None, block_rows=DEFAULT_BLOCK_ROWS):
+        self.features = np.ascontiguousarray(features, dtype=np.float32)
+        self.norms = (self.features ** 2).sum(axis=1)
+        self.players = pd.Series(players).reset_index(drop=True).astype(str)
+        self.block_rows = block_rows
+        self.position_masks = {}
+        if positions is not None:
+            codes = [position_codes(position) for position in positions]
+            for code in set().union(*codes):
+                self.position_masks[code] = np.array([code in row for row in codes])
+        # A player who changed clubs has one row per team; the first row stands for the player
+        self._rows_by_name = {}
+        for row, name in enumerate(self.players):
+            self._rows_by_name.setdefault(name, row)
+        self._max_rows_per_name = int(self.players.value_counts().max()) if len(self.players) else 1
+
+    @classmethod
+    def from_cluster_model(cls, cluster_model, frame, player_field='Player', position_field='Position'):
+        """Index a player frame in the feature space of a saved ClusterModel"""
+        positions = frame[position_field].to_numpy() if position_field in frame.columns else None
+        return cls(cluster_model.transform(frame), frame[player_field].to_numpy(), positions)
+
+    def rows(self, names):
+        """Map player names to index rows, raising KeyError for unknown players"""
+        missing = [name for name in names if name not in self._rows_by_name]
+        if missing:
+            raise KeyError(f"Not in the index: {', '.join(missing)}")
+        return np.array([self._rows_by_name[name] for name in names], dtype=np.intp)
+
+    def candidate_mask(self, positions=None):
+        if not positions:
+            return None
+        mask = np.zeros(len(self.features), dtype=bool)
+        for code in positions:
+            mask |= self.position_masks.get(code, False)
+        return mask
+
+    def search(self, queries, k=10, positions=None, exclude_rows=None):
+        """Return (rows, distances), both n_queries x k, of the nearest players to each query vector
+
+        positions restricts the candidates to players with any of these position
+        codes; exclude_rows[i] is an index row never returned for query i.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        query_norms = (queries ** 2).sum(axis=1)
+        mask = self.candidate_mask(positions)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.intp)
+        best_distances = np.empty((len(queries), 0), dtype=np.float32)
+
+        for start in range(0, len(self.features), self.block_rows):
+            block = slice(start, start + self.block_rows)
+            distances = query_norms[:, None] - 2 * queries @ self.features[block].T + self.norms[None, block]
+            block_rows = np.arange(start, start + distances.shape[1])
+            if mask is not None:
+                distances[:, ~mask[block]] = np.inf
+            if exclude_rows is not None:
+                hits = (exclude_rows[:, None] == block_rows[None, :])
+                distances[hits] = np.inf
+            # Merge this block's candidates with the running top-k
+            rows = np.hstack([best_rows, np.broadcast_to(block_rows, distances.shape)])
+            distances = np.hstack([best_distances, distances])
+            keep = min(k, distances.shape[1])
+            top = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+            best_rows = np.take_along_axis(rows, top, axis=1)
+            best_distances = np.take_along_axis(distances, top, axis=1)
+
+        order = np.argsort(best_distances, axis=1, kind='stable')
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_distances = np.sqrt(np.maximum(np.take_along_axis(best_distances, order, axis=1), 0))
+        return best_rows, best_distances
+
+    def most_similar(self, names, k=10, positions=None):
+        """Top-k most similar players for every named player, as one long frame"""
+        query_rows = self.rows(names)
+        # Over-fetch so the player's other team rows can be dropped and k neighbours remain
+        rows, distances = self.search(self.features[query_rows], k + self._max_rows_per_name - 1,
+                                      positions, exclude_rows=query_rows)
+        players = self.players.to_numpy()
+        results = []
+        for name, neighbour_rows, neighbour_distances in zip(names, rows, distances):
+            found = np.isfinite(neighbour_distances) & (players[neighbour_rows] != name)
+            neighbour_rows, neighbour_distances = neighbour_rows[found][:k], neighbour_distances[found][:k]
+            results.append(pd.DataFrame({
+                'Player': name,
+                'Rank': np.arange(1, len(neighbour_rows) + 1),
+                'Similar Player': players[neighbour_rows],
+                'Distance': neighbour_distances,
+            }))
+        return pd.concat(results, ignore_index=True)
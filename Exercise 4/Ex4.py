@@ -1,141 +1,193 @@
 import os
-import json
-import time
+import sys
+import argparse
 import re
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.http_cache import ResponseCache, CacheMiss
+from pipeline.player_table import RESULT_CSV
+from pipeline.feature_store import FeatureStore
+from pipeline.instrument import count, span, stage
+from name_matcher import NameMatcher, fold, team_key
+from value_cache import ValueCache, DEFAULT_PATH as VALUE_CACHE_PATH, DEFAULT_TTL, DEFAULT_MISS_TTL
+
+MARKET_VALUES_URL = "https://www.transfermarkt.com/premier-league/marktwerte/wettbewerb/GB1"
+COMPETITION_URL = "https://www.transfermarkt.com/premier-league/startseite/wettbewerb/GB1"
+# One row per (Player, Team) target, as returned by get_transfer_values
+RESULT_COLUMNS = ['Player', 'Team', 'Value_M€', 'Match Score']
 
 
 class TransferValueScraper:
-    def __init__(self):
+    def __init__(self, page_cache=None, workers=4, rate=1.0, club_fallback=True,
+                 value_cache_path=VALUE_CACHE_PATH, value_ttl=DEFAULT_TTL, miss_ttl=DEFAULT_MISS_TTL,
+                 cache_only=False, browser_max_pages=40):
         self.script_location = os.path.dirname(os.path.abspath(__file__))
+        self.page_cache = page_cache or ResponseCache()
+        self.workers = workers
+        self.rate = rate
+        self.club_fallback = club_fallback
+        self.value_cache_path = value_cache_path
+        self.value_ttl = value_ttl
+        self.miss_ttl = miss_ttl
+        self.cache_only = cache_only
+        self.browser_max_pages = browser_max_pages
+        self.browser_pool = None
         pd.set_option('future.no_silent_downcasting', True)
 
     def load_player_data(self):
         """Load and preprocess player performance data"""
-        data_path = os.path.join(self.script_location, "..", "Exercise 1", "results.csv")
-        print(f"Loading player data from: {data_path}")
+        print(f"Loading player data from: {os.path.dirname(RESULT_CSV)}")
 
         try:
-            player_df = pd.read_csv(data_path, encoding='utf-8')
-            print("Available columns:", player_df.columns.tolist())
-
-            # Process minutes played
-            player_df['Minutes'] = (
-                player_df['Minutes']
-                .str.replace(',', '')
-                .pipe(pd.to_numeric, errors='coerce')
-            )
-
+            # Minutes comes from the shared feature store, already numeric
+            features = FeatureStore().open()
+            # The fbref id, when the table has one, keys the value cache
+            keys = [column for column in ['Player', 'Team', 'Position', 'Player ID'] if column in features.keys.columns]
+            player_df = features.frame(['Minutes'], keys=keys)
             return player_df[player_df['Minutes'] > 900].copy()
         except FileNotFoundError:
-            print(f"Error: Data file not found at {data_path}")
+            print(f"Error: Data file not found at {RESULT_CSV}")
             exit(1)
 
-    def manage_cache(self, cache_file='transfer_cache.json'):
-        """Handle caching of transfer values"""
-        self.cache_path = os.path.join(self.script_location, cache_file)
-
-        def load():
-            if os.path.exists(self.cache_path):
-                with open(self.cache_path, 'r') as cache:
-                    return json.load(cache)
-            return {}
-
-        def save(data):
-            with open(self.cache_path, 'w') as cache:
-                json.dump(data, cache)
-
-        return load, save
-
-    def get_transfer_values(self, player_names):
-        """Retrieve transfer values from Transfermarkt"""
-        load_cache, save_cache = self.manage_cache()
-        cached_data = load_cache()
-        results = []
-
-        # Check cache first
-        cached_players = [p for p in player_names if p in cached_data]
-        results.extend(
-            {'Player': p, 'Value_M€': cached_data[p]}
-            for p in cached_players
-        )
-
-        # Identify players needing scraping
-        to_scrape = [p for p in player_names if p not in cached_data]
-        if not to_scrape:
-            print("Using cached values only")
-            return pd.DataFrame(results)
-
-        # Configure browser
-        browser_options = Options()
-        browser_options.add_argument("--headless")
-        browser_options.add_argument("--disable-gpu")
-        browser_options.add_argument("--no-sandbox")
-        browser_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64)")
-
-        try:
-            with webdriver.Chrome(
-                    service=Service(ChromeDriverManager().install()),
-                    options=browser_options
-            ) as driver:
-
-                print("Accessing Transfermarkt...")
-                driver.get("https://www.transfermarkt.com/premier-league/marktwerte/wettbewerb/GB1")
-
-                WebDriverWait(driver, 15).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "table.items"))
-
-                page_content = BeautifulSoup(driver.page_source, 'html.parser')
-                player_table = page_content.select_one("table.items")
-
-                if player_table:
-                    for
-                row in player_table.select("tr.odd, tr.even"):
-                self._process_player_row(row, to_scrape, results, cached_data)
-
-                # Handle players not found
-                self._handle_missing_players(to_scrape, results, cached_data)
-                save_cache(cached_data)
-
-        except Exception as e:
-            print(f"Scraping interrupted: {str(e)}")
-            self._handle_missing_players(to_scrape, results, cached_data)
-            save_cache(cached_data)
-
-        return pd.DataFrame(results)
-
-    def _process_player_row(self, row, target_players, results, cache):
-        """Extract data from a single player row"""
+    def player_keys(self, players):
+        """Stable cache key per row: the fbref player id when the table has one, else the folded name and club"""
+        keys = [f'name:{fold(player)}|{team_key(team)}' for player, team in zip(players['Player'], players['Team'])]
+        if 'Player ID' in players.columns:
+            keys = [f'fbref:{player_id}' if isinstance(player_id, str) and player_id else key
+                    for player_id, key in zip(players['Player ID'], keys)]
+        return keys
+
+    def get_transfer_values(self, players):
+        """Retrieve transfer values from Transfermarkt for a frame of Player/Team rows
+
+        Players are identified by (Player, Team), so namesakes at different
+        clubs are looked up, cached and reported separately.
+        """
+        targets = players.drop_duplicates(['Player', 'Team'])
+        keys = dict(zip(zip(targets['Player'], targets['Team']), self.player_keys(targets)))
+
+        with ValueCache(self.value_cache_path, self.value_ttl, self.miss_ttl) as value_cache:
+            # One query answers the whole player list; expired entries are simply not returned
+            with span('value_cache.get', players=len(keys)):
+                cached = value_cache.get_many(keys.values())
+            count('value_cache.hit', len(cached))
+            count('value_cache.miss', len(keys) - len(cached))
+            results = [{'Player': player, 'Team': team,
+                        'Value_M€': np.nan if cached[key]['value'] is None else cached[key]['value']}
+                       for (player, team), key in keys.items() if key in cached]
+
+            # Identify players needing scraping
+            to_scrape = [target for target, key in keys.items() if key not in cached]
+            if not to_scrape:
+                print("Using cached values only")
+                return pd.DataFrame(results, columns=RESULT_COLUMNS)
+            if self.cache_only:
+                print(f"Cache-only mode: {len(to_scrape)} players have no cached value")
+                self._handle_missing_players(to_scrape, results)
+                return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+            # The crawler (and with it requests) is only loaded when something must be fetched
+            from transfermarkt_crawler import TransfermarktCrawler
+
+            found = {}
+            misses = []
+            crawler = TransfermarktCrawler(self.page_cache, self.workers, self.rate,
+                                           fallback=self._fetch_with_browser)
+            try:
+                # Rows of every list page are streamed into the matcher as the pages arrive
+                matcher = NameMatcher(*zip(*to_scrape))
+                rows = (row for url, html in crawler.list_pages(MARKET_VALUES_URL)
+                        for row in self._parse_rows(html, url=url))
+                with span('market_value_list', players=len(to_scrape)):
+                    self._record_matches(matcher.match_all(rows), results, found)
+                to_scrape = [target for target in to_scrape if target not in found]
+
+                # Players missing from the list are looked up on their own club's squad page
+                if to_scrape and self.club_fallback:
+                    wanted = {team_key(team) for _, team in to_scrape}
+                    pages = crawler.club_pages(COMPETITION_URL, lambda club: team_key(club) in wanted)
+                    rows = (row for club, url, html in pages for row in self._parse_rows(html, club, url))
+                    matcher = NameMatcher(*zip(*to_scrape))
+                    with span('club_pages', players=len(to_scrape), clubs=len(wanted)):
+                        self._record_matches(matcher.match_all(rows), results, found)
+                    to_scrape = [target for target in to_scrape if target not in found]
+
+                # Misses are only cached, and only until they expire, once every page was read
+                self._handle_missing_players(to_scrape, results)
+                if crawler.failed:
+                    print(f"{len(crawler.failed)} pages could not be fetched; misses are not cached")
+                else:
+                    misses = [(keys[target], target[0], None, None) for target in to_scrape]
+
+            except CacheMiss as e:
+                # Offline runs must not poison the value cache with misses
+                print(f"Offline mode: {str(e)}")
+                self._handle_missing_players(to_scrape, results)
+
+            except Exception as e:
+                print(f"Scraping interrupted: {str(e)}")
+                self._handle_missing_players(to_scrape, results)
+
+            finally:
+                crawler.close()
+                if self.browser_pool is not None:
+                    self.browser_pool.close()
+                    self.browser_pool = None
+                # Values found before any interruption are kept, in one transaction
+                with span('value_cache.put'):
+                    value_cache.put_many([(keys[target], target[0], value, url)
+                                          for target, (value, url) in found.items()] + misses)
+
+        return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+    def _record_matches(self, matches, results, found):
+        count('matched_players', len(matches))
+        for match, (value, url) in matches.values():
+            results.append({'Player': match.player, 'Team': match.team, 'Value_M€': value,
+                            'Match Score': round(match.score, 3)})
+            found[(match.player, match.team)] = (None if pd.isna(value) else value, url)
+
+    def _parse_rows(self, html, club=None, url=None):
+        """Yield (name, club, (value, url)) for every player row of a list or squad page"""
+        from bs4 import BeautifulSoup
+        player_table = BeautifulSoup(html, 'html.parser').select_one("table.items")
+        if player_table is None:
+            return
+        for row in player_table.select("tr.odd, tr.even"):
+            parsed = self._process_player_row(row)
+            if parsed:
+                count('rows_parsed')
+                name, row_club, value = parsed
+                yield name, club or row_club, (value, url)
+
+    def _fetch_with_browser(self, url):
+        """Render a page in headless Chrome when plain HTTP is refused, and cache it"""
+        if self.browser_pool is None:
+            # The browser stack is started only when a page really needs it
+            from pipeline.browser_pool import BrowserPool
+            self.browser_pool = BrowserPool(size=1, max_pages=self.browser_max_pages)
+        print("Accessing Transfermarkt...")
+        html = self.browser_pool.fetch(url, "table.items")
+        # Only a page that shows the player table may stand in for later runs
+        if 'class="items"' in html:
+            self.page_cache.store(url, html)
+        return html
+
+    def _process_player_row(self, row):
+        """Extract (name, club, value in millions EUR) from a single player row, or None"""
         name_element = row.select_one("td.hauptlink a")
         value_element = row.select_one("td.rechts.hauptlink")
 
         if name_element and value_element:
             player_name = name_element.get_text(strip=True)
-            value_text = value_element.get_text(strip=True)
-
-            # Convert value to millions EUR
-            value = self._parse_value(value_text)
-
-            # Match with our target players
-            for target in target_players:
-                if (target.lower() in player_name.lower() or
-                        player_name.lower() in target.lower()):
-                    results.append({
-                        'Player': target,
-                        'Value_M€': value
-                    })
-                    cache[target] = value
-                    target_players.remove(target)
-                    break
+            club_element = row.select_one("a[href*='/verein/'][title], a[href*='/verein/'] img[alt]")
+            club = None
+            if club_element is not None:
+                club = club_element.get('title') or club_element.get('alt')
+            return player_name, club, self._parse_value(value_element.get_text(strip=True))
+        return None
 
     def _parse_value(self, value_text):
         """Convert transfer value text to numeric"""
@@ -152,28 +204,29 @@ class TransferValueScraper:
             return value * 1000
         return value
 
-    def _handle_missing_players(self, players, results, cache):
-        """Handle players not found on the page"""
-        for player in players:
+    def _handle_missing_players(self, players, results):
+        """Handle (player, team) targets not found on the page"""
+        count('unmatched_players', len(players))
+        for player, team in players:
             results.append({
                 'Player': player,
+                'Team': team,
                 'Value_M€': np.nan
             })
-            cache[player] = np.nan
 
     def save_results(self, player_data, transfer_data, output_file='transfer_values.csv'):
         """Save final results to file"""
         merged_data = player_data.merge(
             transfer_data,
-            left_on='First Name',
-            right_on='Player',
+            on=['Player', 'Team'],
             how='left'
         )
 
         output_columns = [
-            'First Name', 'Team', 'Position',
-            'Minutes', 'Value_M€'
+            'Player', 'Team', 'Position',
+            'Minutes', 'Value_M€', 'Match Score'
         ]
+        merged_data = merged_data.reindex(columns=output_columns)
 
         try:
             output_path = os.path.join(self.script_location, output_file)
@@ -197,22 +250,14 @@ class TransferValueScraper:
 - Base Models: 
   * XGBoost (non-linear relationships)
   * ElasticNet (regularized linear features)
-- Meta Model: 3-layer Neural Network
-- Feature Selection: Recursive Feature Elimination with CV
-
-3. Implementation:
-from sklearn.ensemble import StackingRegressor
-from xgboost import XGBRegressor
-from sklearn.linear_model import ElasticNet
-
-# Position-specific pipelines
-model = StackingRegressor(
-    estimators=[
-        ('xgb', XGBRegressor(objective='reg:squarederror')),
-        ('enet', ElasticNet(alpha=0.1))
-    ],
-    final_estimator=MLPRegressor(hidden_layer_sizes=(64,32))
-)"""
+- Meta Model: Ridge regression with cross-validated regularization
+
+3. Implementation (valuation.py):
+- One pipeline per primary position (GK, DF, MF, FW) with enough labelled players, plus a pooled model
+- Median imputation and standard scaling, then a StackingRegressor of gradient boosting
+  (XGBoost when installed) and ElasticNet with a RidgeCV meta model, on log1p(value)
+- Hyperparameters chosen by randomized search with k-fold CV, run in parallel across cores
+- Fitted models saved to model/valuation.joblib; --predict scores the whole league in one batch"""
 
         doc_path = os.path.join(self.script_location, 'valuation_methodology.txt')
         with open(doc_path, 'w', encoding='utf-8') as doc:
@@ -221,17 +266,39 @@ model = StackingRegressor(
 
 
 if __name__ == "__main__":
-    scraper = TransferValueScraper()
-
-    # Load and process player data
-    players_df = scraper.load_player_data()
-    print(f"Processing {len(players_df)} players with sufficient minutes")
-
-    # Get transfer values
-    transfer_values = scraper.get_transfer_values(players_df['First Name'].unique())
-
-    # Save results
-    scraper.save_results(players_df, transfer_values)
-
-    # Generate documentation
-    scraper.generate_documentation()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description='Attach Transfermarkt values to player stats')
+    arg_parser.add_argument('--cache-ttl', type=float, default=12,
+                            help='hours a cached page is reused before it is fetched again')
+    arg_parser.add_argument('--offline', action='store_true',
+                            help='parse purely from cached pages without any network access')
+    arg_parser.add_argument('--cache-only', action='store_true',
+                            help='merge only cached transfer values; never crawl or start a browser')
+    arg_parser.add_argument('--workers', type=int, default=4, help='pages fetched concurrently')
+    arg_parser.add_argument('--rate', type=float, default=1.0, help='average Transfermarkt requests per second')
+    arg_parser.add_argument('--value-ttl', type=float, default=DEFAULT_TTL / 86400,
+                            help='days a found transfer value is reused before it is fetched again')
+    arg_parser.add_argument('--miss-ttl', type=float, default=DEFAULT_MISS_TTL / 3600,
+                            help='hours before a player who was not found is looked up again')
+    arg_parser.add_argument('--no-club-fallback', action='store_true',
+                            help='do not look up unmatched players on their club squad pages')
+    args = arg_parser.parse_args()
+
+    with stage('ex4'):
+        scraper = TransferValueScraper(ResponseCache(ttl=args.cache_ttl * 3600, offline=args.offline),
+                                       args.workers, args.rate, not args.no_club_fallback,
+                                       value_ttl=args.value_ttl * 86400, miss_ttl=args.miss_ttl * 3600,
+                                       cache_only=args.cache_only)
+
+        # Load and process player data
+        players_df = scraper.load_player_data()
+        print(f"Processing {len(players_df)} players with sufficient minutes")
+
+        # Get transfer values
+        # The fbref id, when present, keys the value cache
+        transfer_values = scraper.get_transfer_values(players_df)
+
+        # Save results
+        scraper.save_results(players_df, transfer_values)
+
+        # Generate documentation
+        scraper.generate_documentation()
\ No newline at end of file
@@ -0,0 +1,159 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+# Letters NFKD does not decompose into a base letter plus accents
+SPECIAL_LETTERS = str.maketrans({
+    'ø': 'o', 'Ø': 'O', 'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE',
+    'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D', 'ð': 'd', 'þ': 'th', 'ı': 'i',
+})
+
+# fbref's short club names mapped to the names Transfermarkt uses, both folded
+TEAM_ALIASES = {
+    'manchester utd': 'manchester united',
+    'man utd': 'manchester united',
+    'man city': 'manchester city',
+    'newcastle utd': 'newcastle united',
+    'nott ham forest': 'nottingham forest',
+    'sheffield utd': 'sheffield united',
+    'tottenham': 'tottenham hotspur',
+    'spurs': 'tottenham hotspur',
+    'west ham': 'west ham united',
+    'wolves': 'wolverhampton wanderers',
+    'brighton': 'brighton hove albion',
+    'leicester': 'leicester city',
+    'ipswich': 'ipswich town',
+    'luton': 'luton town',
+    'leeds': 'leeds united',
+}
+TEAM_NOISE = {'fc', 'afc', 'and', 'the'}
+
+
+def fold(text):
+    """Lowercase, accent-free, punctuation-free form of a name"""
+    if not isinstance(text, str):
+        return ''
+    text = unicodedata.normalize('NFKD', text.translate(SPECIAL_LETTERS))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', text.lower()).split())
+
+
+def team_key(team):
+    folded = ' '.join(token for token in fold(team).split() if token not in TEAM_NOISE)
+    return TEAM_ALIASES.get(folded, folded)
+
+
+def trigrams(folded):
+    padded = f'  {folded} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Match:
+    """A scored link between a scraped name and one target player
+
+    score is the name similarity (1.0 for an exact folded match) plus the
+    matcher's team bonus when the clubs agree.
+    """
+
+    __slots__ = ('target', 'player', 'team', 'score', 'method')
+
+    def __init__(self, target, player, team, score, method):
+        self.target = target
+        self.player = player
+        self.team = team
+        self.score = score
+        self.method = method
+
+    def __repr__(self):
+        return f'Match({self.player!r}, {self.team!r}, score={self.score:.2f}, method={self.method!r})'
+
+
+class NameMatcher:
+    """Index of target players for matching scraped (name, club) pairs
+
+    Lookups first try the exact folded full name, disambiguated by club, and
+    only then fall back to candidates sharing name trigrams, which are scored
+    by trigram overlap and token containment. A club match adds to the score;
+    candidates that stay too close to call are rejected instead of guessed.
+    """
+
+    def __init__(self, players, teams=None, min_score=0.75, team_bonus=0.1, margin=0.05):
+        self.players = list(players)
+        self.teams = list(teams) if teams is not None else [None] * len(self.players)
+        self.min_score = min_score
+        self.team_bonus = team_bonus
+        self.margin = margin
+        self.folded = [fold(player) for player in self.players]
+        self.tokens = [set(folded.split()) for folded in self.folded]
+        self.grams = [trigrams(folded) for folded in self.folded]
+        self.team_keys = [team_key(team) for team in self.teams]
+
+        self.by_name = defaultdict(list)
+        self.by_gram = defaultdict(list)
+        for target, folded in enumerate(self.folded):
+            self.by_name[folded].append(target)
+            for gram in self.grams[target]:
+                self.by_gram[gram].append(target)
+
+    def _team_agrees(self, target, team):
+        return bool(team) and self.team_keys[target] == team
+
+    def _similarity(self, target, folded, tokens, grams):
+        overlap = len(grams & self.grams[target])
+        score = 2 * overlap / (len(grams) + len(self.grams[target]))
+        # 'Gabriel Magalhaes' vs 'Gabriel dos Santos Magalhaes': every token of one name is in the other
+        shorter, longer = sorted((tokens, self.tokens[target]), key=len)
+        if len(shorter) > 1 and shorter <= longer:
+            score = max(score, 0.9)
+        return score
+
+    def candidates(self, name, team=None, limit=5):
+        """Return up to limit Matches for a scraped name, best first"""
+        folded = fold(name)
+        team = team_key(team) if team else None
+        exact = self.by_name.get(folded, [])
+        if exact:
+            scored = [(1.0 + self.team_bonus * self._team_agrees(target, team), target, 'exact')
+                      for target in exact]
+        else:
+            grams = trigrams(folded)
+            tokens = set(folded.split())
+            # Only targets sharing a reasonable share of trigrams are scored at all
+            shared = Counter(target for gram in grams for target in self.by_gram.get(gram, ()))
+            floor = max(1, len(grams) // 3)
+            scored = []
+            for target, count in shared.items():
+                if count < floor:
+                    continue
+                score = self._similarity(target, folded, tokens, grams)
+                score += self.team_bonus * self._team_agrees(target, team)
+                scored.append((score, target, 'fuzzy'))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [Match(target, self.players[target], self.teams[target], score, method)
+                for score, target, method in scored[:limit]]
+
+    def match(self, name, team=None):
+        """Best Match for a scraped name, or None when nothing is close or the best is ambiguous"""
+        found = self.candidates(name, team, limit=2)
+        if not found or found[0].score < self.min_score:
+            return None
+        if len(found) > 1 and found[0].score - found[1].score < self.margin:
+            return None
+        return found[0]
+
+    def match_all(self, rows):
+        """Match (name, team, payload) rows one-to-one to targets, best scores first
+
+        The result does not depend on row order: all rows are scored, then each
+        target is given to its highest-scoring row. Returns {target: (Match, payload)}.
+        """
+        proposals = []
+        for name, team, payload in rows:
+            found = self.match(name, team)
+            if found is not None:
+                proposals.append((found, payload))
+        proposals.sort(key=lambda item: (-item[0].score, item[0].target))
+        assigned = {}
+        for found, payload in proposals:
+            assigned.setdefault(found.target, (found, payload))
+        return assigned
@@ -0,0 +1,167 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import unescape
+from urllib.parse import urljoin
+
+import requests
+
+from pipeline.http_cache import CacheMiss
+from pipeline.http_session import create_session, is_transient, retry_after
+from pipeline.instrument import span
+from pipeline.rate_limit import TokenBucket
+
+ANCHOR = re.compile(r'<a\s[^>]*>', re.IGNORECASE)
+ATTRIBUTE = re.compile(r'([\w-]+)\s*=\s*"([^"]*)"')
+PAGE_NUMBER = re.compile(r'/page/(\d+)')
+CLUB_PATH = re.compile(r'/startseite/verein/\d+')
+# What a real list or squad page contains and a bot check or consent page does not
+ITEMS_MARKER = 'class="items"'
+# A competition page is only useful for its club links
+CLUB_MARKER = '/startseite/verein/'
+
+
+class BlockedPage(requests.RequestException):
+    """A successful response without the expected content, e.g. a bot check or consent page"""
+
+
+def anchors(html):
+    """Yield the attribute dict of every <a> tag in the page"""
+    for tag in ANCHOR.findall(html):
+        yield {name.lower(): unescape(value) for name, value in ATTRIBUTE.findall(tag)}
+
+
+def page_urls(html, first_url):
+    """URLs of result pages 2..N discovered from the pager links of page 1"""
+    templates = {}
+    for attributes in anchors(html):
+        href = attributes.get('href', '')
+        found = PAGE_NUMBER.search(href)
+        if found:
+            templates[int(found.group(1))] = href
+    if not templates:
+        return []
+    last = max(templates)
+    template = templates[last]
+    # The pager only links a window of pages, so the rest are built from the last link
+    return [urljoin(first_url, PAGE_NUMBER.sub(f'/page/{number}', template)) for number in range(2, last + 1)]
+
+
+def club_urls(html, base_url):
+    """Map club name to club page URL for every club linked from a competition page"""
+    clubs = {}
+    for attributes in anchors(html):
+        href = attributes.get('href', '')
+        title = attributes.get('title')
+        if title and CLUB_PATH.search(href):
+            clubs.setdefault(title, urljoin(base_url, href.split('?')[0]))
+    return clubs
+
+
+class TransfermarktCrawler:
+    """Concurrent, rate-limited fetcher for Transfermarkt list and squad pages
+
+    Pages go through the shared response cache, so fresh pages cost no request
+    and offline runs read only what is cached. Every request takes a token from
+    one bucket shared by all worker threads. Transient failures (connection
+    errors, 429 and 5xx) are retried here with exponential backoff, each attempt
+    taking its own token; the session itself never retries. Pages that still
+    fail, or come back without their table (a bot check), are reported in
+    failed instead of stopping the crawl.
+    """
+
+    def __init__(self, cache, workers=4, rate=1.0, burst=2, attempts=3, backoff=2.0,
+                 timeout=30, fallback=None):
+        self.cache = cache
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.attempts = attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.fallback = fallback
+        # Retries happen only in fetch(), where every attempt goes through the token bucket
+        self.session = None if cache.offline else create_session(workers, retries=0)
+        self.failed = []
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def fetch(self, url, marker=ITEMS_MARKER):
+        """Return the HTML of one page, from the cache or with retries over HTTP
+
+        Pages without marker are neither cached nor returned: BlockedPage is
+        raised, so callers count them as failed or hand them to the fallback.
+        """
+        with span('fetch', url=url) as current:
+            html = self.cache.cached_or_none(url, marker)
+            if html is not None:
+                return html
+            for attempt in range(self.attempts):
+                current.set(attempts=attempt + 1)
+                self.bucket.acquire()
+                try:
+                    html = self.cache.fetch(self.session, url, timeout=self.timeout, marker=marker)
+                    if marker not in html:
+                        current.set(blocked=True)
+                        raise BlockedPage(f"{url} returned a page without {marker}")
+                    return html
+                except BlockedPage:
+                    raise
+                except requests.RequestException as e:
+                    # A 404 or 403 will not change on a retry
+                    if attempt + 1 == self.attempts or not is_transient(e):
+                        raise
+                    delay = retry_after(e, self.backoff * 2 ** attempt)
+                    print(f"Fetching {url} failed ({e}), retrying in {delay:.0f}s")
+                    time.sleep(delay)
+
+    def crawl(self, urls):
+        """Fetch pages concurrently and yield (url, html) as each one completes"""
+        urls = list(urls)
+        if not urls:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls))) as pool:
+            futures = {pool.submit(self.fetch, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    yield url, future.result()
+                except (CacheMiss, requests.RequestException) as e:
+                    print(f"Skipping {url}: {e}")
+                    self.failed.append(url)
+
+    def list_pages(self, first_url):
+        """Yield (url, html) for every page of a paginated market value list
+
+        Page 1 decides how many pages there are; when HTTP fails or returns a
+        page without the player table (a bot check), the fallback (e.g. a
+        browser) is used for it. Later pages without the table are skipped and
+        reported in failed.
+        """
+        try:
+            first_html = self.fetch(first_url)
+        except requests.RequestException as e:
+            if self.fallback is None:
+                raise
+            print(f"HTTP fetch of {first_url} failed ({e}), falling back to browser")
+            first_html = self.fallback(first_url)
+        yield first_url, first_html
+        yield from self.crawl(page_urls(first_html, first_url))
+
+    def club_pages(self, competition_url, wanted=None):
+        """Yield (club, url, html) for the squad pages of the competition's clubs
+
+        wanted filters clubs by a predicate on the club name.
+        """
+        try:
+            clubs = club_urls(self.fetch(competition_url, CLUB_MARKER), competition_url)
+        except (CacheMiss, requests.RequestException) as e:
+            print(f"Skipping club pages: {e}")
+            self.failed.append(competition_url)
+            return
+        if wanted is not None:
+            clubs = {club: url for club, url in clubs.items() if wanted(club)}
+        names = {url: club for club, url in clubs.items()}
+        for url, html in self.crawl(names):
+            yield names[url], url, html
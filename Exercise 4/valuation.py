@@ -0,0 +1,222 @@
+"""Position-specific transfer value models trained on the Ex1 features
+
+    python "Exercise 4/valuation.py"              train on transfer_values.csv and save the models
+    python "Exercise 4/valuation.py" --predict    score every player of the current Ex1 table
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.feature_store import FeatureStore
+from pipeline.player_table import ROOT
+from pipeline.instrument import span, stage
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(SCRIPT_DIR, 'model', 'valuation.joblib')
+VALUES_CSV = os.path.join(SCRIPT_DIR, 'transfer_values.csv')
+PREDICTIONS_CSV = os.path.join(SCRIPT_DIR, 'predicted_values.csv')
+# Fitted imputer/scaler per CV fold, reused by every hyperparameter candidate
+CACHE_DIR = os.path.join(ROOT, '.cache', 'valuation')
+CACHE_LIMIT = '256M'
+KEYS = ['Player', 'Team', 'Position']
+POSITIONS = ['GK', 'DF', 'MF', 'FW']
+# Positions with fewer labelled players than this are scored by the pooled model
+MIN_GROUP_ROWS = 40
+POOLED = 'ALL'
+
+
+def position_groups(positions):
+    """Primary fbref position of each row ('MF,FW' -> 'MF'), or ALL when unknown"""
+    primary = pd.Series(positions, dtype='object').fillna('').astype(str).str.split(',').str[0].str.strip()
+    return primary.where(primary.isin(POSITIONS), POOLED).to_numpy()
+
+
+def gradient_booster():
+    """XGBoost when it is installed, otherwise sklearn's histogram gradient boosting"""
+    try:
+        from xgboost import XGBRegressor
+    except ImportError:
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        return HistGradientBoostingRegressor(max_iter=200, random_state=0), {
+            'model__gbm__learning_rate': [0.03, 0.1],
+            'model__gbm__max_depth': [3, None],
+            'model__gbm__min_samples_leaf': [5, 20],
+        }
+    # One thread per model; the search already runs one candidate per core
+    return XGBRegressor(objective='reg:squarederror', n_estimators=200, tree_method='hist', n_jobs=1), {
+        'model__gbm__learning_rate': [0.03, 0.1],
+        'model__gbm__max_depth': [3, 6],
+        'model__gbm__min_child_weight': [1, 5],
+    }
+
+
+def build_search(folds, n_iter, jobs, memory):
+    """Randomized search over a stacked booster + ElasticNet pipeline, scored by k-fold CV"""
+    from sklearn.ensemble import StackingRegressor
+    from sklearn.impute import SimpleImputer
+    from sklearn.linear_model import ElasticNet, RidgeCV
+    from sklearn.model_selection import KFold, ParameterGrid, RandomizedSearchCV
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    booster, grid = gradient_booster()
+    grid['model__enet__alpha'] = [0.01, 0.1, 1.0]
+    stack = StackingRegressor(
+        estimators=[('gbm', booster), ('enet', ElasticNet(l1_ratio=0.5, max_iter=5000))],
+        final_estimator=RidgeCV(),
+        cv=3
+    )
+    pipeline = Pipeline([
+        # Columns a position never fills (keeper stats for outfielders) are kept as zeros
+        ('impute', SimpleImputer(strategy='median', keep_empty_features=True)),
+        ('scale', StandardScaler()),
+        ('model', stack)
+    ], memory=memory)
+    return RandomizedSearchCV(
+        pipeline, grid, n_iter=min(n_iter, len(ParameterGrid(grid))),
+        cv=KFold(folds, shuffle=True, random_state=0),
+        scoring='neg_mean_absolute_error', n_jobs=jobs, random_state=0
+    )
+
+
+def load_training_data(values_path=VALUES_CSV, features=None):
+    """Join the feature store with the values Ex4 scraped; return (numeric frame, values, positions)"""
+    features = features or FeatureStore().open()
+    values = pd.read_csv(values_path)
+    if not {'Player', 'Team', 'Value_M€'} <= set(values.columns):
+        raise ValueError(f"{values_path} has no Player/Team/Value_M€ columns; rerun Ex4 to refresh it")
+    values = values.dropna(subset=['Value_M€']).drop_duplicates(['Player', 'Team'])
+    table = features.frame(keys=KEYS)
+    joined = table.merge(values[['Player', 'Team', 'Value_M€']], on=['Player', 'Team'], how='inner')
+    return joined[features.columns], joined['Value_M€'].to_numpy(dtype=np.float64), joined['Position']
+
+
+def min_labelled(folds):
+    """Fewest labelled players k-fold CV can train and score a model on"""
+    return folds * 2
+
+
+class ValuationModel:
+    """One fitted pipeline per position group, plus a pooled model for everything else
+
+    Models predict log1p(value in million EUR); predict() scores a whole
+    table with one call per position group.
+    """
+
+    def __init__(self, columns, models, info=None):
+        self.columns = list(columns)
+        self.models = dict(models)
+        self.info = dict(info or {})
+
+    @classmethod
+    def train(cls, data, values, positions, folds=5, n_iter=8, jobs=-1, cache_dir=CACHE_DIR):
+        from joblib import Memory
+
+        memory = Memory(cache_dir, verbose=0)
+        matrix = data.to_numpy(dtype=np.float64, na_value=np.nan)
+        target = np.log1p(values)
+        groups = position_groups(positions)
+        models, scores = {}, {}
+        if len(groups) < min_labelled(folds):
+            raise ValueError(f"Only {len(groups)} labelled players; need at least {min_labelled(folds)}")
+        # Positions too small for their own model are left to the pooled one
+        minimum = max(MIN_GROUP_ROWS, min_labelled(folds))
+        names = [group for group in POSITIONS if (groups == group).sum() >= minimum] + [POOLED]
+        for group in names:
+            rows = np.ones(len(groups), dtype=bool) if group == POOLED else groups == group
+            search = build_search(folds, n_iter, jobs, memory)
+            with span('valuation_search', position=group, rows=int(rows.sum())):
+                search.fit(matrix[rows], target[rows])
+            model = search.best_estimator_
+            # The fold cache is only for training; the saved model must not depend on it
+            model.set_params(memory=None)
+            models[group] = model
+            scores[group] = {'rows': int(rows.sum()), 'cv_mae_log': float(-search.best_score_),
+                             'params': {key: value for key, value in search.best_params_.items()}}
+            print(f"{group}: {rows.sum()} players, CV MAE {-search.best_score_:.3f} (log1p M€), "
+                  f"params {search.best_params_}")
+        # Kept for the next run on the same data, but never allowed to grow without bound
+        memory.reduce_size(bytes_limit=CACHE_LIMIT)
+        return cls(data.columns, models, info={'scores': scores, 'folds': folds, 'trained_at': time.time()})
+
+    def predict(self, frame):
+        """Predicted value in million EUR for every row of frame (needs the feature columns and Position)"""
+        matrix = frame[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        groups = position_groups(frame['Position']) if 'Position' in frame.columns else np.full(len(frame), POOLED)
+        groups = np.where(np.isin(groups, list(self.models)), groups, POOLED)
+        predictions = np.empty(len(frame), dtype=np.float64)
+        for group, model in self.models.items():
+            rows = groups == group
+            if rows.any():
+                predictions[rows] = model.predict(matrix[rows])
+        return np.expm1(predictions)
+
+    def save(self, path=MODEL_PATH):
+        from joblib import dump
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        dump({'columns': self.columns, 'models': self.models, 'info': self.info}, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        """Return the saved model, or None when there is none yet"""
+        if not os.path.exists(path):
+            return None
+        from joblib import load
+        saved = load(path)
+        return cls(saved['columns'], saved['models'], saved['info'])
+
+
+def predict_league(model, output_path=PREDICTIONS_CSV):
+    """Score every player of the current Ex1 table in one batched call and save the table"""
+    features = FeatureStore().open()
+    table = features.frame(model.columns, keys=KEYS)
+    start = time.perf_counter()
+    with span('valuation_predict', rows=len(table)):
+        table['Predicted_Value_M€'] = model.predict(table).round(2)
+    elapsed = time.perf_counter() - start
+    table[KEYS + ['Predicted_Value_M€']].to_csv(output_path, index=False)
+    print(f"Scored {len(table)} players in {elapsed * 1000:.1f} ms; predictions saved to {output_path}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Train or apply the position-specific valuation models')
+    arg_parser.add_argument('--predict', action='store_true',
+                            help='score every player with the saved models instead of training')
+    arg_parser.add_argument('--values', default=VALUES_CSV, help='Ex4 output with the scraped values')
+    arg_parser.add_argument('--folds', type=int, default=5, help='cross-validation folds')
+    arg_parser.add_argument('--iterations', type=int, default=8,
+                            help='hyperparameter candidates tried per position')
+    arg_parser.add_argument('--jobs', type=int, default=-1, help='parallel CV fits (-1: all cores)')
+    args = arg_parser.parse_args()
+
+    if args.predict:
+        model = ValuationModel.load()
+        if model is None:
+            print(f"No saved valuation model at {MODEL_PATH}; train one first")
+            sys.exit(1)
+        predict_league(model)
+        return
+
+    data, values, positions = load_training_data(args.values)
+    if len(values) < min_labelled(args.folds):
+        # Nothing to learn from yet (e.g. Ex4 has not scraped values online); not an error
+        print(f"Only {len(values)} players in {args.values} have a transfer value; need at least "
+              f"{min_labelled(args.folds)} to train. Skipping valuation, no model written")
+        return
+    print(f"Training on {len(values)} players with a transfer value and {data.shape[1]} features")
+    start = time.perf_counter()
+    model = ValuationModel.train(data, values, positions, args.folds, args.iterations, args.jobs)
+    model.save()
+    print(f"Trained in {time.perf_counter() - start:.1f}s; models saved to {MODEL_PATH}")
+    predict_league(model)
+
+
+if __name__ == "__main__":
+    with stage('valuation'):
+        main()
@@ -0,0 +1,83 @@
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transfer_values.sqlite')
+DEFAULT_TTL = 7 * 24 * 60 * 60
+# Players not found are retried after a day instead of being cached as NaN forever
+DEFAULT_MISS_TTL = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfer_values (
+    player_id TEXT PRIMARY KEY,
+    player TEXT NOT NULL,
+    value REAL,
+    currency TEXT,
+    source_url TEXT,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+UPSERT = """
+INSERT INTO transfer_values (player_id, player, value, currency, source_url, fetched_at, expires_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(player_id) DO UPDATE SET
+    player = excluded.player, value = excluded.value, currency = excluded.currency,
+    source_url = excluded.source_url, fetched_at = excluded.fetched_at, expires_at = excluded.expires_at
+"""
+
+
+class ValueCache:
+    """SQLite store of transfer values keyed by a stable player id
+
+    Every entry carries its own expiry: found values live for ttl seconds and
+    misses (value NULL) for miss_ttl, after which they are fetched again. The
+    database runs in WAL mode and every write is one transaction, so concurrent
+    runs neither block readers nor leave a half-written cache behind.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, miss_ttl=DEFAULT_MISS_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_many(self, player_ids, now=None):
+        """Return {player_id: row dict} for every unexpired entry among player_ids, in one query"""
+        now = time.time() if now is None else now
+        # The id list travels as one JSON parameter, so the query size does not grow with it
+        cursor = self.connection.execute(
+            'SELECT player_id, player, value, currency, source_url, fetched_at FROM transfer_values '
+            'WHERE player_id IN (SELECT value FROM json_each(?)) AND expires_at > ?',
+            (json.dumps(list(player_ids)), now))
+        columns = [description[0] for description in cursor.description]
+        return {row[0]: dict(zip(columns, row)) for row in cursor}
+
+    def put_many(self, entries, now=None):
+        """Upsert (player_id, player, value, source_url) entries; value None records a miss"""
+        now = time.time() if now is None else now
+        rows = [(player_id, player, value, 'EUR' if value is not None else None, source_url, now,
+                 now + (self.ttl if value is not None else self.miss_ttl))
+                for player_id, player, value, source_url in entries]
+        with self.connection:
+            self.connection.executemany(UPSERT, rows)
+        return len(rows)
+
+    def purge_expired(self, now=None):
+        now = time.time() if now is None else now
+        with self.connection:
+            return self.connection.execute('DELETE FROM transfer_values WHERE expires_at <= ?', (now,)).rowcount
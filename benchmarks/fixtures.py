@@ -0,0 +1,149 @@
+"""Deterministic offline fixtures for the benchmark suite
+
+The fbref and Transfermarkt pages are rebuilt from the checked-in player
+table in the markup the parsers expect (fbref's data-stat cells and commented
+tables, Transfermarkt's table.items rows and pager), so every stage can run
+without network access at any scale.
+"""
+import html
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Exercise 1'))
+sys.path.insert(0, os.path.join(ROOT, 'Exercise 4'))
+from fbref_tables import TABLE_SPECS
+from Ex1 import page_paths, page_url
+from Ex4 import MARKET_VALUES_URL, COMPETITION_URL
+from pipeline.http_cache import ResponseCache
+
+BASE_TABLE = os.path.join(ROOT, 'Exercise 1', 'result.csv')
+# Columns that identify a player rather than measure one; never jittered
+TEXT_COLUMNS = {'Player', 'Player ID', 'Nation', 'Position', 'Team', 'Competition', 'Season'}
+
+
+def scaled_table(scale, seed=0, base_path=BASE_TABLE):
+    """The player table repeated scale times, with renamed copies and jittered numbers
+
+    Copies keep the team, position and integer-ness of their original so that
+    every stage sees realistic data, only more of it.
+    """
+    base = pd.read_csv(base_path, dtype=str, keep_default_na=False)
+    if scale == 1:
+        return base
+    rng = np.random.default_rng(seed)
+    copies = [base]
+    for copy in range(1, scale):
+        frame = base.copy()
+        frame['Player'] = frame['Player'] + f' {copy + 1}'
+        for column in frame.columns:
+            if column in TEXT_COLUMNS:
+                continue
+            values = pd.to_numeric(frame[column].str.replace(',', '', regex=False), errors='coerce')
+            jittered = values * rng.uniform(0.8, 1.2, len(values))
+            integral = values.dropna().eq(values.dropna().round()).all()
+            text = jittered.round() if integral else jittered.round(2)
+            text = text.map(lambda value: '' if pd.isna(value) else (f'{value:.0f}' if integral else f'{value:g}'))
+            frame[column] = text.where(values.notna(), frame[column])
+        copies.append(frame)
+    return pd.concat(copies, ignore_index=True).sort_values('Player', kind='stable').reset_index(drop=True)
+
+
+def fbref_page(table, name):
+    """One fbref stats page holding the columns of TABLE_SPECS[name]; secondary tables are commented out"""
+    spec = TABLE_SPECS[name]
+    rows = []
+    for index, record in enumerate(table.to_dict('records')):
+        cells = [f'<th data-stat="ranker">{index + 1}</th>']
+        for stat, column in spec['columns'].items():
+            value = record.get(column, '')
+            value = '' if value == 'N/a' else value
+            if stat == 'age' and value:
+                value = f'{value}-100'
+            if stat == 'player':
+                cells.append(f'<td data-stat="player" data-append-csv="p{index:06d}">'
+                             f'<a href="/en/players/p{index:06d}/x">{html.escape(value)}</a></td>')
+            else:
+                cells.append(f'<td data-stat="{stat}">{html.escape(str(value))}</td>')
+        rows.append('<tr>' + ''.join(cells) + '</tr>')
+        if index % 25 == 24:
+            rows.append('<tr class="thead"><th>Rk</th><th>Player</th></tr>')
+    body = (f'<table class="stats_table" id="{spec["table_id"]}"><thead><tr><th>Rk</th></tr></thead>'
+            f'<tbody>{"".join(rows)}</tbody></table>')
+    if name != 'standard':
+        body = f'<div class="placeholder"></div><!--\n{body}\n-->'
+    return f'<html><body>{body}</body></html>'
+
+
+def fbref_pages(table):
+    return {page_url('premier-league', None, name): fbref_page(table, name) for name in page_paths}
+
+
+def transfermarkt_pages(table, per_page=25, listed=0.8, seed=0):
+    """Market value list pages for a share of the players, squad pages for the rest
+
+    Listed players appear under a slightly different spelling (accents
+    dropped, club as Transfermarkt names it) so the matcher does real work.
+    """
+    rng = np.random.default_rng(seed)
+    players = table[['Player', 'Team']].drop_duplicates('Player').reset_index(drop=True)
+    on_list = rng.random(len(players)) < listed
+    values = rng.integers(1, 180, len(players))
+
+    def row(index, name, club, value, club_link=True):
+        club_cell = (f'<td class="zentriert"><a title="{html.escape(club)} FC" href="/c/startseite/verein/1">'
+                     f'<img alt="{html.escape(club)} FC"></a></td>') if club_link else ''
+        return (f'<tr class="{"odd" if index % 2 else "even"}"><td class="hauptlink">'
+                f'<a href="/p/profil/spieler/{index}">{html.escape(name)}</a></td>{club_cell}'
+                f'<td class="rechts hauptlink">€{value}.00m</td></tr>')
+
+    pages = {}
+    listed_rows = [(index, record) for index, record in enumerate(players.to_dict('records')) if on_list[index]]
+    page_count = max(1, -(-len(listed_rows) // per_page))
+    pager = ''.join(f'<a class="tm-pagination__link" href="/premier-league/marktwerte/wettbewerb/GB1/page/{n}">{n}</a>'
+                    for n in range(2, min(page_count, 10) + 1))
+    if page_count > 10:
+        pager += f'<a class="tm-pagination__link" href="/premier-league/marktwerte/wettbewerb/GB1/page/{page_count}">»</a>'
+    for page in range(page_count):
+        chunk = listed_rows[page * per_page:(page + 1) * per_page]
+        rows = ''.join(row(index, record['Player'].replace('é', 'e'), record['Team'], values[index])
+                       for index, record in chunk)
+        url = MARKET_VALUES_URL if page == 0 else f'{MARKET_VALUES_URL}/page/{page + 1}'
+        pages[url] = f'<div class="pager">{pager}</div><table class="items"><tbody>{rows}</tbody></table>'
+
+    clubs = sorted(players['Team'].unique())
+    links = ''.join(f'<a title="{html.escape(club)}" href="/club-{number}/startseite/verein/{number}">{html.escape(club)}</a>'
+                    for number, club in enumerate(clubs))
+    pages[COMPETITION_URL] = f'<html><body>{links}</body></html>'
+    for number, club in enumerate(clubs):
+        squad = [(index, record) for index, record in enumerate(players.to_dict('records'))
+                 if record['Team'] == club and not on_list[index]]
+        rows = ''.join(row(index, record['Player'], club, values[index], club_link=False) for index, record in squad)
+        pages[f'https://www.transfermarkt.com/club-{number}/startseite/verein/{number}'] = (
+            f'<table class="items"><tbody>{rows}</tbody></table>')
+    return pages
+
+
+def seed_cache(cache_dir, pages):
+    """Store pages in a ResponseCache directory so offline runs read them"""
+    cache = ResponseCache(cache_dir=cache_dir)
+    for url, page in pages.items():
+        cache.store(url, page)
+    return len(pages)
+
+
+def build_cache(cache_dir, scale):
+    """Seed cache_dir with every page a run at scale needs; return the number of player rows"""
+    table = scaled_table(scale)
+    seed_cache(cache_dir, fbref_pages(table))
+    seed_cache(cache_dir, transfermarkt_pages(table))
+    return len(table)
+
+
+if __name__ == "__main__":
+    # Run as a separate process by the benchmark so its memory never counts towards a stage
+    print(build_cache(sys.argv[1], int(sys.argv[2])))
@@ -0,0 +1,212 @@
+"""Offline benchmark of the four pipeline stages at several data scales
+
+Each scale runs in its own scratch copy of the tree whose response cache is
+seeded with fixture pages, so Ex1 and Ex4 never touch the network and the
+checked-in outputs are never overwritten. Every stage runs as a subprocess
+with PIPELINE_TRACE pointing at its own trace file; wall time and peak RSS are
+measured per stage, the stage's spans (Ex1 fetch/parse/merge/write, Ex2
+aggregate/report/histograms, ...) are summed by name, and both are compared
+against a stored baseline.
+
+    python benchmarks/run.py --scales 1 10
+    python benchmarks/run.py --update-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DEFAULT_OUTPUT = os.path.join(HERE, 'results.json')
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+
+# Stage name -> command run from the scratch tree, in pipeline order
+STAGES = {
+    'ex1': ['Exercise 1/Ex1.py', '--offline'],
+    'ex2': ['Exercise 2/Ex2.py'],
+    'ex3': ['Exercise 3/Ex3.py', '--refit'],
+    'ex4': ['Exercise 4/Ex4.py', '--offline'],
+}
+# Absolute slack on top of the relative tolerance, so millisecond spans do not flag on noise
+SPAN_SLACK_S = 0.05
+# Generated state that would let a stage skip work it is supposed to be timed on
+COPY_IGNORE = shutil.ignore_patterns('__pycache__', '.cache', 'model', 'partitions', 'snapshots',
+                                     'team_stats_state.pkl', 'transfer_values.sqlite*')
+
+
+def prepare_tree(workdir, scale):
+    """Copy the code into workdir and seed its response cache with fixtures; return the row count
+
+    Fixtures are built in a child process: a stage's peak RSS starts from
+    the RSS of the process that spawned it, so this one has to stay small.
+    """
+    shutil.copytree(os.path.join(ROOT, 'pipeline'), os.path.join(workdir, 'pipeline'), ignore=COPY_IGNORE)
+    for stage in STAGES.values():
+        folder = os.path.dirname(stage[0])
+        if not os.path.exists(os.path.join(workdir, folder)):
+            shutil.copytree(os.path.join(ROOT, folder), os.path.join(workdir, folder), ignore=COPY_IGNORE)
+    cache_dir = os.path.join(workdir, '.cache', 'http')
+    output = subprocess.run([sys.executable, os.path.join(HERE, 'fixtures.py'), cache_dir, str(scale)],
+                            check=True, capture_output=True, text=True).stdout
+    return int(output.split()[-1])
+
+
+def run_stage(command, workdir, log_path, trace_path):
+    """Run one stage to completion, tracing its spans to trace_path; return (wall seconds, peak RSS in MB, return code)"""
+    environment = dict(os.environ, MPLBACKEND='Agg', PYTHONHASHSEED='0', PIPELINE_TRACE=trace_path)
+    # Every stage starts a run of its own rather than joining the caller's
+    environment.pop('PIPELINE_RUN_ID', None)
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable] + command, cwd=workdir, env=environment,
+                                   stdout=log, stderr=subprocess.STDOUT)
+        # wait4 reports the child's own resource usage, including any workers it waited for
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    peak_kb = usage.ru_maxrss if sys.platform != 'darwin' else usage.ru_maxrss / 1024
+    return wall, peak_kb / 1024, process.returncode
+
+
+def span_timings(trace_path, rows):
+    """Sum the spans of one stage's trace by name: {name: {'count', 'total_s', 'rows_per_s'}}
+
+    Spans that run in parallel (one fetch per page) add up to more than the
+    stage's wall time; the total is the work done, not the time waited.
+    """
+    spans = {}
+    if not os.path.exists(trace_path):
+        return spans
+    with open(trace_path) as trace:
+        for line in trace:
+            record = json.loads(line)
+            if record.get('type') != 'span':
+                continue
+            entry = spans.setdefault(record['name'], {'count': 0, 'total_s': 0.0})
+            entry['count'] += 1
+            entry['total_s'] += record['duration_s']
+    for entry in spans.values():
+        entry['total_s'] = round(entry['total_s'], 3)
+        entry['rows_per_s'] = round(rows / entry['total_s'], 1) if entry['total_s'] else None
+    return spans
+
+
+def run_scale(scale, stages, keep=False):
+    workdir = tempfile.mkdtemp(prefix=f'bench-{scale}x-')
+    results = []
+    try:
+        print(f"Scale {scale}x: building fixtures in {workdir}")
+        rows = prepare_tree(workdir, scale)
+        for stage in stages:
+            log_path = os.path.join(workdir, f'{stage}.log')
+            trace_path = os.path.join(workdir, f'{stage}.trace.jsonl')
+            wall, peak, returncode = run_stage(STAGES[stage], workdir, log_path, trace_path)
+            spans = span_timings(trace_path, rows)
+            results.append({
+                'stage': stage, 'scale': scale, 'rows': rows,
+                'wall_s': round(wall, 3), 'peak_rss_mb': round(peak, 1),
+                'rows_per_s': round(rows / wall, 1) if wall else None,
+                'returncode': returncode,
+                'spans': spans,
+            })
+            print(f"  {stage}: {wall:8.2f} s {peak:8.1f} MB {rows / wall:10.1f} rows/s"
+                  + ('' if returncode == 0 else f"  FAILED ({returncode}), see {log_path}"))
+            for name, timing in sorted(spans.items(), key=lambda item: -item[1]['total_s']):
+                if name != stage:
+                    print(f"    {name:<26} {timing['total_s']:8.2f} s  x{timing['count']}")
+            if returncode != 0:
+                keep = True
+                break
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a message for every stage that got slower or bigger than baseline allows"""
+    reference = {(entry['stage'], entry['scale']): entry for entry in baseline.get('results', [])}
+    regressions = []
+    for entry in results:
+        previous = reference.get((entry['stage'], entry['scale']))
+        if previous is None or entry['returncode'] != 0:
+            continue
+        for metric in ('wall_s', 'peak_rss_mb'):
+            if entry[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{entry['stage']} at {entry['scale']}x: {metric} "
+                                   f"{previous[metric]} -> {entry[metric]}")
+        # A slower step can hide inside an unchanged stage total, e.g. Ex2's statistics behind its plotting
+        previous_spans = previous.get('spans', {})
+        for name, timing in entry.get('spans', {}).items():
+            reference_span = previous_spans.get(name)
+            if reference_span is None:
+                continue
+            if timing['total_s'] > reference_span['total_s'] * (1 + tolerance) + SPAN_SLACK_S:
+                regressions.append(f"{entry['stage']} at {entry['scale']}x: span {name} total_s "
+                                   f"{reference_span['total_s']} -> {timing['total_s']}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--scales', nargs='+', type=int, default=[1, 10, 100],
+                            help='Multiples of the checked-in player table to benchmark')
+    arg_parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES),
+                            help='Stages to run; later stages need the outputs of earlier ones')
+    arg_parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    arg_parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    arg_parser.add_argument('--update-baseline', action='store_true',
+                            help='Write this run to the baseline file instead of comparing against it')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative increase in wall time or peak RSS before failing')
+    arg_parser.add_argument('--keep', action='store_true', help='Keep the scratch trees for inspection')
+    args = arg_parser.parse_args()
+
+    stages = [stage for stage in STAGES if stage in args.stages]
+    results = []
+    for scale in args.scales:
+        results.extend(run_scale(scale, stages, keep=args.keep))
+    report = {'machine': machine_info(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f"Results saved to {args.output}")
+    failed = [entry for entry in results if entry['returncode'] != 0]
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 1 if failed else 0
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --update-baseline to record one")
+        return 1 if failed else 0
+    with open(args.baseline) as source:
+        baseline = json.load(source)
+    if baseline.get('machine') != report['machine']:
+        print("Note: baseline was recorded on a different machine, comparisons are approximate")
+    regressions = compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print(f"Regression: {message}")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
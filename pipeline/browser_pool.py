@@ -0,0 +1,198 @@
+"""Warm, resource-blocking headless Chrome drivers shared by the scrapers
+
+Only pages that plain HTTP cannot serve should come here. Each driver skips
+images, fonts, stylesheets, media and ad scripts, returns from get() at
+DOMContentLoaded and then waits only for the selector of the table the
+caller needs. Drivers are reused across pages and replaced after max_pages
+to cap the memory Chrome accumulates.
+"""
+import os
+import threading
+
+from pipeline.http_cache import DEFAULT_CACHE_DIR
+from pipeline.http_session import USER_AGENT
+from pipeline.instrument import count, span
+
+# URL patterns never needed to read a stats table
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.avif',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.css', '*.mp4', '*.webm',
+    '*doubleclick.net*', '*googlesyndication.com*', '*google-analytics.com*', '*googletagmanager.com*',
+    '*adservice.google.*', '*amazon-adsystem.com*', '*adnxs.com*', '*criteo.*', '*taboola.com*',
+    '*outbrain.com*', '*scorecardresearch.com*', '*quantserve.com*',
+]
+# Chrome content settings: 2 blocks the resource type outright
+BLOCKED_CONTENT = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.managed_default_content_settings.fonts': 2,
+    'profile.managed_default_content_settings.media_stream': 2,
+    'profile.managed_default_content_settings.notifications': 2,
+    'profile.managed_default_content_settings.plugins': 2,
+}
+# chromedriver location resolved by webdriver-manager, remembered between runs
+DRIVER_PATH_FILE = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), 'chromedriver_path')
+
+# Driver binary resolved by chromedriver_path() for the rest of the process
+browser_state = {}
+
+
+def chromedriver_path():
+    """Resolve the chromedriver binary once: $CHROMEDRIVER, the path saved by an earlier run, or webdriver-manager"""
+    if 'driver_path' in browser_state:
+        return browser_state['driver_path']
+    path = os.environ.get('CHROMEDRIVER')
+    if not path and os.path.exists(DRIVER_PATH_FILE):
+        with open(DRIVER_PATH_FILE, 'r', encoding='utf-8') as handle:
+            path = handle.read().strip()
+    if not path or not os.path.exists(path):
+        # Only this step reaches the network, and only when no usable driver is known
+        from webdriver_manager.chrome import ChromeDriverManager
+        path = ChromeDriverManager().install()
+        os.makedirs(os.path.dirname(DRIVER_PATH_FILE), exist_ok=True)
+        with open(DRIVER_PATH_FILE, 'w', encoding='utf-8') as handle:
+            handle.write(path)
+    browser_state['driver_path'] = path
+    return path
+
+
+class _Lease:
+    """A driver together with the number of pages it has loaded"""
+
+    __slots__ = ('driver', 'pages')
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class BrowserPool:
+    """Up to size headless Chrome drivers handed out to one caller at a time
+
+    Drivers are started on first demand, so a run that never needs a browser
+    never starts one. Without a driver_path the binary is found by
+    chromedriver_path() when the first driver starts. fetch() is safe to call
+    from several threads; each call has a driver to itself for the duration of
+    the page load.
+    """
+
+    def __init__(self, size=1, driver_path=None, max_pages=50, page_timeout=30, wait_timeout=15,
+                 blocked_urls=BLOCKED_URLS, user_agent=USER_AGENT):
+        self.size = size
+        self.driver_path = driver_path
+        self.max_pages = max_pages
+        self.page_timeout = page_timeout
+        self.wait_timeout = wait_timeout
+        self.blocked_urls = list(blocked_urls)
+        self.user_agent = user_agent
+        self._idle = []
+        self._started = 0
+        self._available = threading.Condition()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start_driver(self):
+        # Selenium is only needed once a page really requires a browser
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        options = Options()
+        options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_argument(f'user-agent={self.user_agent}')
+        options.add_experimental_option('prefs', BLOCKED_CONTENT)
+        # get() returns at DOMContentLoaded; the table is awaited explicitly
+        options.page_load_strategy = 'eager'
+        service = Service(self.driver_path or chromedriver_path())
+        with span('browser_start'):
+            driver = webdriver.Chrome(service=service, options=options)
+        driver.set_page_load_timeout(self.page_timeout)
+        if self.blocked_urls:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.blocked_urls})
+        count('browser.started')
+        return _Lease(driver)
+
+    def _acquire(self):
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError('BrowserPool is closed')
+                if self._idle:
+                    return self._idle.pop()
+                if self._started < self.size:
+                    self._started += 1
+                    break
+                # Every driver is busy; wait for one to be returned or retired
+                self._available.wait()
+        try:
+            return self._start_driver()
+        except Exception:
+            self._retired()
+            raise
+
+    def _retired(self):
+        with self._available:
+            self._started -= 1
+            self._available.notify()
+
+    def _release(self, lease, broken=False):
+        if broken or lease.pages >= self.max_pages or self._closed:
+            # A retired driver frees its slot; the next caller starts a fresh one
+            self._quit(lease)
+            self._retired()
+            return
+        with self._available:
+            self._idle.append(lease)
+            self._available.notify()
+
+    def _quit(self, lease):
+        try:
+            lease.driver.quit()
+        except Exception:
+            pass
+
+    def fetch(self, url, selector=None):
+        """Load url and return the page source once selector (CSS) is present
+
+        Without a selector the source is returned at DOMContentLoaded. A
+        driver that fails for any reason but a wait timeout is discarded.
+        """
+        lease = self._acquire()
+        try:
+            with span('browser_fetch', url=url):
+                lease.driver.get(url)
+                if selector:
+                    from selenium.webdriver.common.by import By
+                    from selenium.webdriver.support import expected_conditions as EC
+                    from selenium.webdriver.support.ui import WebDriverWait
+                    WebDriverWait(lease.driver, self.wait_timeout).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
+                html = lease.driver.page_source
+        except Exception as e:
+            # A page that never showed the table says nothing about the driver itself
+            self._release(lease, broken=type(e).__name__ != 'TimeoutException')
+            raise
+        lease.pages += 1
+        count('browser.pages')
+        self._release(lease)
+        return html
+
+    def close(self):
+        """Quit every idle driver; drivers still in use are quit when they are returned"""
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+            self._available.notify_all()
+        for lease in idle:
+            self._quit(lease)
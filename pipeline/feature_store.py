@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from pipeline.instrument import count, span
+from pipeline.player_table import ROOT, RESULT_CSV, RESULT_PARQUET, load_player_table, _parquet_reader
+
+DEFAULT_STORE_DIR = os.path.join(ROOT, '.cache', 'features')
+
+
+def source_path():
+    """The file load_player_table would read: the typed parquet table when current, else result.csv"""
+    return RESULT_PARQUET if _parquet_reader() is not None else RESULT_CSV
+
+
+def source_hash(path=None, block_size=1 << 20):
+    path = path or source_path()
+    digest = hashlib.sha256(os.path.basename(path).encode('utf-8'))
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FeatureMatrix:
+    """Read-only, memory-mapped view of one materialized player table
+
+    raw holds every numeric column as float64 with NaN for missing values and
+    scaled holds the same columns mean-imputed and standardized. Both are
+    stored column-major, so frames over all columns or a run of adjacent
+    columns are views of the mapped file rather than copies.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as handle:
+            self.meta = json.load(handle)
+        self.columns = self.meta['columns']
+        self.fill_values = np.array(self.meta['fill_values'])
+        self.scale_means = np.array(self.meta['scale_means'])
+        self.scales = np.array(self.meta['scales'])
+        self.raw = np.load(os.path.join(directory, 'raw.npy'), mmap_mode='r')
+        self.scaled = np.load(os.path.join(directory, 'scaled.npy'), mmap_mode='r')
+        self._keys = None
+
+    @property
+    def source_hash(self):
+        return self.meta['source_hash']
+
+    @property
+    def keys(self):
+        """Text and category columns (Player, Team, Position, ...) in row order"""
+        if self._keys is None:
+            self._keys = pd.read_parquet(os.path.join(self.directory, 'keys.parquet'))
+        return self._keys
+
+    def column_indices(self, columns=None, exclude=()):
+        selected = list(columns) if columns is not None else self.columns
+        return [self.columns.index(column) for column in selected if column not in exclude]
+
+    def _select(self, matrix, indices):
+        # A contiguous run of columns is a slice, and so still a view of the mapped file
+        if indices and indices == list(range(indices[0], indices[-1] + 1)):
+            return matrix[:, indices[0]:indices[-1] + 1]
+        return matrix[:, indices]
+
+    def frame(self, columns=None, exclude=(), keys=(), kind='raw'):
+        """Numeric columns as a DataFrame, optionally prefixed by key columns
+
+        kind='raw' restores the table's original dtypes (integer and nullable
+        columns are copies) so values print as they did before; kind='imputed'
+        fills NaN with the column means.
+        """
+        indices = self.column_indices(columns, exclude)
+        names = [self.columns[index] for index in indices]
+        values = self._select(self.raw, indices)
+        if kind == 'imputed':
+            values = np.where(np.isnan(values), self.fill_values[indices], values)
+        data = pd.DataFrame(values, columns=names, copy=False)
+        if kind == 'raw':
+            for name in names:
+                if self.meta['dtypes'][name] != 'float64':
+                    data[name] = data[name].astype(self.meta['dtypes'][name])
+        if keys:
+            data = pd.concat([self.keys[list(keys)], data], axis=1)
+        return data
+
+    def scaled_matrix(self, columns=None, exclude=()):
+        return self._select(self.scaled, self.column_indices(columns, exclude))
+
+    def scaler(self, columns=None, exclude=()):
+        """A fitted StandardScaler carrying the stored statistics of the selected columns"""
+        from sklearn.preprocessing import StandardScaler
+        indices = self.column_indices(columns, exclude)
+        scaler = StandardScaler()
+        scaler.mean_ = self.scale_means[indices]
+        scaler.scale_ = self.scales[indices]
+        scaler.var_ = np.array(self.meta['variances'])[indices]
+        scaler.n_features_in_ = len(indices)
+        scaler.feature_names_in_ = np.array([self.columns[index] for index in indices], dtype=object)
+        scaler.n_samples_seen_ = len(self.raw)
+        return scaler
+
+
+class FeatureStore:
+    """Cleaned numeric player matrices materialized once per source snapshot
+
+    Each version lives in a directory named after the hash of the source file,
+    so every consumer of the same snapshot maps the same files and shares one
+    copy in the page cache. Older versions are removed when a new one is built.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+
+    def open(self):
+        """Return the FeatureMatrix of the current source, materializing it if needed"""
+        path = source_path()
+        digest = source_hash(path)
+        directory = os.path.join(self.store_dir, digest)
+        if not os.path.exists(os.path.join(directory, 'meta.json')):
+            count('feature_store.miss')
+            with span('feature_store.materialize', source=os.path.basename(path)):
+                self.materialize(digest, directory)
+        else:
+            count('feature_store.hit')
+        return FeatureMatrix(directory)
+
+    def materialize(self, digest, directory):
+        table = load_player_table()
+        numeric = table.select_dtypes(include=['number'])
+        raw = np.asfortranarray(numeric.astype('float64').to_numpy(na_value=np.nan))
+        # Same preprocessing as Ex3: mean imputation, then StandardScaler statistics
+        fill_values = np.nanmean(raw, axis=0)
+        imputed = np.where(np.isnan(raw), fill_values, raw)
+        scale_means = imputed.mean(axis=0)
+        variances = imputed.var(axis=0)
+        scales = np.sqrt(variances)
+        scales[scales < 10 * np.finfo(np.float64).eps] = 1.0
+        scaled = np.asfortranarray((imputed - scale_means) / scales)
+
+        tmp_dir = f'{directory}.tmp-{os.getpid()}'
+        os.makedirs(tmp_dir, exist_ok=True)
+        np.save(os.path.join(tmp_dir, 'raw.npy'), raw)
+        np.save(os.path.join(tmp_dir, 'scaled.npy'), scaled)
+        table.drop(columns=numeric.columns).reset_index(drop=True).to_parquet(
+            os.path.join(tmp_dir, 'keys.parquet'), index=False)
+        meta = {
+            'source_hash': digest,
+            'rows': len(raw),
+            'columns': list(numeric.columns),
+            'dtypes': {column: str(dtype) for column, dtype in numeric.dtypes.items()},
+            'fill_values': fill_values.tolist(),
+            'scale_means': scale_means.tolist(),
+            'variances': variances.tolist(),
+            'scales': scales.tolist(),
+        }
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as handle:
+            json.dump(meta, handle, indent=2)
+
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            # Another process materialized the same snapshot first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        for name in os.listdir(self.store_dir):
+            if name != digest and '.tmp-' not in name:
+                shutil.rmtree(os.path.join(self.store_dir, name), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # Materialize the current snapshot once, before the stages that map it start
+    matrix = FeatureStore().open()
+    print(f"Feature matrix of {matrix.meta['rows']} rows x {len(matrix.columns)} columns ready")
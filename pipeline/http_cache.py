@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urldefrag
+
+from pipeline.instrument import count
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'http')
+DEFAULT_TTL = 12 * 60 * 60
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when a page has never been cached"""
+
+
+class ResponseCache:
+    """On-disk cache of raw HTML responses keyed by the hash of their URL
+
+    Callers that know what a good page looks like pass a marker (e.g. the id
+    of the table they parse): responses without it are never stored, and
+    cached entries without it are dropped and treated as misses, so a bot
+    check or consent page cannot stand in for the real page.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+
+    def _paths(self, url):
+        key = hashlib.sha256(urldefrag(url)[0].encode('utf-8')).hexdigest()
+        folder = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(folder, key + '.html.gz'), os.path.join(folder, key + '.json')
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as handle:
+            handle.write(data)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url):
+        """Return the cached metadata for a URL, or None if it was never stored"""
+        _, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as handle:
+                return json.load(handle)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def is_fresh(self, meta):
+        return meta is not None and time.time() - meta['fetched_at'] < self.ttl
+
+    def read(self, url):
+        """Return the cached HTML for a URL, or None if it was never stored"""
+        body_path, _ = self._paths(url)
+        try:
+            with gzip.open(body_path, 'rb') as handle:
+                return handle.read().decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+    def store(self, url, html, headers=None):
+        """Save a freshly fetched page together with its validators"""
+        body_path, meta_path = self._paths(url)
+        body = html.encode('utf-8')
+        headers = headers or {}
+        meta = {
+            'url': urldefrag(url)[0],
+            'fetched_at': time.time(),
+            'sha256': hashlib.sha256(body).hexdigest(),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified')
+        }
+        self._write_atomic(body_path, gzip.compress(body))
+        self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def discard(self, url):
+        """Forget a cached page and its validators"""
+        for path in self._paths(url):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _read_valid(self, url, marker):
+        # A cached page without the marker is what a bot check left behind
+        html = self.read(url)
+        if html is not None and marker is not None and marker not in html:
+            count('http_cache.invalid')
+            self.discard(url)
+            return None
+        return html
+
+    def touch(self, url, meta):
+        """Mark a cached page as revalidated without rewriting its body"""
+        _, meta_path = self._paths(url)
+        meta = dict(meta, fetched_at=time.time())
+        self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def cached_or_none(self, url, marker=None):
+        """Return cached HTML (containing marker, when given) that may be used without a network round-trip"""
+        meta = self.lookup(url)
+        if self.offline:
+            html = self._read_valid(url, marker) if meta else None
+            if html is None:
+                count('http_cache.miss')
+                raise CacheMiss(f'{url} is not cached and offline mode is enabled')
+            count('http_cache.hit')
+            return html
+        if self.is_fresh(meta):
+            html = self._read_valid(url, marker)
+            if html is not None:
+                count('http_cache.hit')
+            return html
+        return None
+
+    def fetch(self, session, url, timeout=30, marker=None):
+        """Fetch a page through the cache, revalidating stale entries when possible
+
+        A response without marker is returned to the caller but not stored.
+        """
+        html = self.cached_or_none(url, marker)
+        if html is not None:
+            return html
+
+        meta = self.lookup(url)
+        if meta is not None and self._read_valid(url, marker) is None:
+            # Nothing worth revalidating; fetch the page in full
+            meta = None
+        conditional = {}
+        if meta is not None:
+            if meta.get('etag'):
+                conditional['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                conditional['If-Modified-Since'] = meta['last_modified']
+
+        count('http_cache.stale' if meta is not None else 'http_cache.miss')
+        response = session.get(urldefrag(url)[0], headers=conditional, timeout=timeout)
+        if response.status_code == 304 and meta is not None:
+            html = self.read(url)
+            if html is not None:
+                count('http_cache.revalidated')
+                self.touch(url, meta)
+                return html
+            response = session.get(urldefrag(url)[0], timeout=timeout)
+        response.raise_for_status()
+        if marker is None or marker in response.text:
+            self.store(url, response.text, response.headers)
+        else:
+            count('http_cache.rejected')
+        return response.text
@@ -0,0 +1,44 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+# Statuses worth asking again for; anything else (404, 403, ...) will not change on a retry
+TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+
+def create_session(pool_size, retries=0, backoff=2):
+    """Keep-alive HTTP session with a connection pool sized for pool_size threads
+
+    retries > 0 lets urllib3 retry transient statuses and connection errors
+    itself. Callers that run their own retry loop (e.g. to take a rate limit
+    token per attempt) keep the default 0, so a page is retried in one layer only.
+    """
+    session = requests.Session()
+    retry = 0
+    if retries:
+        # The last transient response is returned as is, so callers see an HTTPError with its status
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=TRANSIENT_STATUS,
+                      respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT})
+    return session
+
+
+def is_transient(error):
+    """True for connection problems, timeouts and 429/5xx responses; False for other HTTP errors"""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in TRANSIENT_STATUS
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_after(error, default):
+    """Seconds a 429/503 response asks the client to wait, or default when it names none"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return max(default, float(value))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,240 @@
+"""Opt-in timing spans, counters and profiling for the pipeline stages
+
+Everything is off unless one of the environment variables below is set, and
+then span() hands out one shared no-op object and count() returns at once,
+so instrumented code pays a dictionary lookup per call.
+
+    PIPELINE_TRACE=1                 trace to .cache/traces/<run id>.jsonl
+    PIPELINE_TRACE=path.jsonl        trace to the given file
+    PIPELINE_PROFILE=ex1,ex3|all     cProfile those stages, one .prof dump each
+    PIPELINE_TRACEMALLOC=ex2|all     tracemalloc those stages, one top-allocations report each
+
+The trace is JSON lines: one record per finished span (name, parent, start,
+duration_s and any fields) and one record of counters per process at exit.
+Worker processes inherit the run id and the trace file through the
+environment, so a whole run lands in one file.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+TRACE_ENV = 'PIPELINE_TRACE'
+PROFILE_ENV = 'PIPELINE_PROFILE'
+TRACEMALLOC_ENV = 'PIPELINE_TRACEMALLOC'
+RUN_ENV = 'PIPELINE_RUN_ID'
+DEFAULT_TRACE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'traces')
+TRACEMALLOC_TOP = 30
+
+# Trace state of this process, filled in by configure()
+trace_state = {'file': None, 'path': None, 'run': None, 'counters': Counter(), 'lock': threading.Lock(),
+               'profile': set(), 'tracemalloc': set(), 'flush_registered': False}
+_local = threading.local()
+
+
+class _NullSpan:
+    """What span() returns while tracing is off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed region written to the trace when it ends; set() adds fields on the way"""
+
+    __slots__ = ('name', 'fields', 'start', 'parent', '_clock')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self._clock = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self._clock
+        _stack().pop()
+        record = {'type': 'span', 'name': self.name, 'parent': self.parent, 'start': round(self.start, 6),
+                  'duration_s': round(duration, 6), 'thread': threading.current_thread().name}
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.fields)
+        _write(record)
+        return False
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _stage_names(variable):
+    return {name.strip() for name in os.environ.get(variable, '').split(',') if name.strip()}
+
+
+def _write(record):
+    record['run'] = trace_state['run']
+    record['pid'] = os.getpid()
+    line = json.dumps(record, default=str) + '\n'
+    with trace_state['lock']:
+        # One write per line on an O_APPEND file keeps lines from different processes whole
+        os.write(trace_state['file'], line.encode('utf-8'))
+
+
+def configure():
+    """Read the environment and open the trace file; called once at import"""
+    trace_state['profile'] = _stage_names(PROFILE_ENV)
+    trace_state['tracemalloc'] = _stage_names(TRACEMALLOC_ENV)
+    target = os.environ.get(TRACE_ENV, '')
+    if not (target or trace_state['profile'] or trace_state['tracemalloc']):
+        return
+    run = os.environ.get(RUN_ENV) or time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+    os.environ[RUN_ENV] = run
+    trace_state['run'] = run
+    if not target or target.lower() in ('0', 'false', 'no'):
+        return
+    path = os.path.join(DEFAULT_TRACE_DIR, f'{run}.jsonl') if target.lower() in ('1', 'true', 'yes') else target
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Children (process pools, stage subprocesses) append to the same file
+    os.environ[TRACE_ENV] = path
+    trace_state['path'] = path
+    trace_state['file'] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    atexit.register(flush_counters)
+    trace_state['flush_registered'] = True
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _after_fork():
+    # A forked pool worker starts with the parent's counts, which the parent reports itself
+    trace_state['counters'] = Counter()
+    trace_state['lock'] = threading.Lock()
+    trace_state['flush_registered'] = False
+
+
+def _register_worker_flush():
+    # Pool workers leave through os._exit, which skips atexit but runs multiprocessing
+    # finalizers; those registered before the worker started are cleared, hence the delay
+    from multiprocessing.util import Finalize
+    Finalize(None, flush_counters, exitpriority=100)
+    trace_state['flush_registered'] = True
+
+
+def enabled():
+    return trace_state['file'] is not None
+
+
+def span(name, **fields):
+    """Context manager timing one region, e.g. with span('fetch', page=name): ..."""
+    if trace_state['file'] is None:
+        return NULL_SPAN
+    return Span(name, fields)
+
+
+def traced(name=None):
+    """Decorator wrapping every call of a function in a span"""
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if trace_state['file'] is None:
+                return function(*args, **kwargs)
+            with Span(label, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, value=1):
+    """Add value to a named counter, reported once per process at exit"""
+    if trace_state['file'] is None:
+        return
+    if not trace_state['flush_registered']:
+        _register_worker_flush()
+    with trace_state['lock']:
+        trace_state['counters'][name] += value
+
+
+def flush_counters():
+    with trace_state['lock']:
+        counters = dict(trace_state['counters'])
+        trace_state['counters'].clear()
+    if counters and trace_state['file'] is not None:
+        _write({'type': 'counters', 'counters': counters})
+
+
+def _dump_path(stage_name, suffix):
+    directory = os.path.dirname(trace_state['path']) if trace_state['path'] else DEFAULT_TRACE_DIR
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{trace_state['run']}-{stage_name}-{os.getpid()}{suffix}")
+
+
+@contextmanager
+def stage(name):
+    """Top-level span for one pipeline stage, profiled when the environment asks for it
+
+    The cProfile dump opens with pstats or snakeviz; the tracemalloc report
+    lists the lines that allocated the most memory still alive at the end,
+    and the peak is added to the stage's span.
+    """
+    profile_on = name in trace_state['profile'] or 'all' in trace_state['profile']
+    tracemalloc_on = name in trace_state['tracemalloc'] or 'all' in trace_state['tracemalloc']
+    profiler = None
+    if tracemalloc_on:
+        import tracemalloc
+        tracemalloc.start()
+    if profile_on:
+        import cProfile
+        profiler = cProfile.Profile()
+    with span(name, stage=True) as current:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield current
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                path = _dump_path(name, '.prof')
+                profiler.dump_stats(path)
+                print(f"Profile of {name} written to {path}")
+            if tracemalloc_on:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                current.set(tracemalloc_peak_mb=round(peak / 2 ** 20, 1))
+                path = _dump_path(name, '.tracemalloc.txt')
+                with open(path, 'w') as report:
+                    report.write(f"Peak traced memory: {peak / 2 ** 20:.1f} MiB\n")
+                    for statistic in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+                        report.write(f"{statistic}\n")
+                print(f"Allocation report of {name} written to {path}")
+
+
+configure()
@@ -0,0 +1,252 @@
+"""Run the exercise scripts as a DAG of stages with declared inputs and outputs
+
+A stage is skipped when the content hash of its inputs (data files, its own
+code and its command line) matches the last successful run and its outputs
+still exist. Stages whose dependencies are done run concurrently, each in its
+own process, with their output prefixed by the stage name. A stage's input
+schema is checked before it starts, so a table missing a column stops the run
+instead of failing somewhere inside a script. A stage that exits cleanly
+without writing any of its outputs (e.g. valuation before any value was
+scraped) counts as skipped, and is tried again on the next run.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from pipeline.player_table import ROOT
+
+DEFAULT_STATE_PATH = os.path.join(ROOT, '.cache', 'pipeline', 'state.json')
+
+
+class SchemaError(ValueError):
+    """Raised when a stage's input table lacks the columns the stage reads"""
+
+
+class Stage:
+    """One script of the pipeline
+
+    inputs and outputs are paths relative to the repository root (directories
+    are hashed file by file); after names the stages that must finish first.
+    volatile stages read something that cannot be hashed, such as a website,
+    and always run.
+    """
+
+    def __init__(self, name, command, inputs=(), outputs=(), after=(), schema=None, volatile=False):
+        self.name = name
+        self.command = list(command)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.schema = schema
+        self.volatile = volatile
+
+    def __repr__(self):
+        return f'Stage({self.name!r})'
+
+
+class TableSchema:
+    """Columns a stage reads from a CSV table, and which of them must be numeric"""
+
+    def __init__(self, path, columns=(), numeric=()):
+        self.path = path
+        self.columns = list(columns)
+        self.numeric = list(numeric)
+
+    def check(self, stage_name):
+        import pandas as pd
+        path = os.path.join(ROOT, self.path)
+        if not os.path.exists(path):
+            raise SchemaError(f"{stage_name}: input {self.path} does not exist")
+        header = list(pd.read_csv(path, nrows=0).columns)
+        missing = [column for column in self.columns + self.numeric if column not in header]
+        if missing:
+            raise SchemaError(f"{stage_name}: {self.path} lacks columns {', '.join(missing)}")
+        if self.numeric:
+            values = pd.read_csv(path, usecols=self.numeric, dtype=str, keep_default_na=False)
+            broken = []
+            for column in self.numeric:
+                cells = values[column].str.replace(',', '', regex=False)
+                cells = cells[~cells.isin(['', 'N/a'])]
+                if pd.to_numeric(cells, errors='coerce').isna().any():
+                    broken.append(column)
+            if broken:
+                raise SchemaError(f"{stage_name}: non-numeric values in {self.path} columns {', '.join(broken)}")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_files(paths):
+    """Expand input paths to (relative path, absolute path) of every file, in a stable order"""
+    files = []
+    for path in paths:
+        absolute = os.path.join(ROOT, path)
+        if os.path.isdir(absolute):
+            for folder, subfolders, names in os.walk(absolute):
+                subfolders[:] = sorted(name for name in subfolders if name != '__pycache__')
+                for name in sorted(names):
+                    if not name.endswith('.pyc'):
+                        full = os.path.join(folder, name)
+                        files.append((os.path.relpath(full, ROOT), full))
+        else:
+            files.append((path, absolute))
+    return files
+
+
+def stage_hash(stage):
+    """Hash of everything a stage's outputs depend on that lives on disk"""
+    digest = hashlib.sha256(json.dumps(stage.command).encode('utf-8'))
+    for relative, absolute in input_files(stage.inputs):
+        file_hash = file_digest(absolute) if os.path.exists(absolute) else 'missing'
+        digest.update(f'{relative}\0{file_hash}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PipelineState:
+    """Input hash of the last successful run of every stage, kept in one JSON file"""
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                self.stages = json.load(handle)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.stages = {}
+
+    def is_current(self, stage, digest):
+        outputs_exist = all(os.path.exists(os.path.join(ROOT, output)) for output in stage.outputs)
+        return outputs_exist and self.stages.get(stage.name, {}).get('input_hash') == digest
+
+    def record(self, stage, digest, duration):
+        self.stages[stage.name] = {'input_hash': digest, 'finished_at': time.time(), 'duration_s': round(duration, 3)}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(self.stages, handle, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def wrote_outputs(stage, since):
+    """True when the stage declares no outputs or updated at least one of them after since"""
+    if not stage.outputs:
+        return True
+    for output in stage.outputs:
+        path = os.path.join(ROOT, output)
+        # One second of slack for file systems with coarse timestamps
+        if os.path.exists(path) and os.path.getmtime(path) >= since - 1:
+            return True
+    return False
+
+
+def _pump(stream, prefix, lock):
+    # Lines of concurrent stages are printed whole, each tagged with its stage
+    for line in iter(stream.readline, ''):
+        with lock:
+            sys.stdout.write(f'[{prefix}] {line}')
+            sys.stdout.flush()
+    stream.close()
+
+
+def topological_order(stages):
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = [name for name in stage.after if name not in names]
+        if unknown:
+            raise ValueError(f"{stage.name} depends on unknown stages {', '.join(unknown)}")
+    ordered, done = [], set()
+    while len(ordered) < len(stages):
+        ready = [stage for stage in stages if stage.name not in done and set(stage.after) <= done]
+        if not ready:
+            raise ValueError("Stage dependencies form a cycle")
+        ordered.extend(ready)
+        done.update(stage.name for stage in ready)
+    return ordered
+
+
+def run_pipeline(stages, force=(), skip=(), jobs=None, dry_run=False, state=None):
+    """Run stages in dependency order, concurrently where possible; return {stage: status}
+
+    status is one of 'ran', 'skipped' (inputs unchanged, or the stage chose to
+    write nothing), 'excluded' (in skip),
+    'failed' or 'blocked' (a dependency failed). A schema error stops the
+    whole run: running stages are terminated and the error is raised.
+    """
+    stages = topological_order(stages)
+    state = state or PipelineState()
+    jobs = jobs or len(stages)
+    force = set(force)
+    status = {}
+    running = {}
+    print_lock = threading.Lock()
+    environment = dict(os.environ, PYTHONUNBUFFERED='1')
+
+    def finished(name):
+        return status.get(name) in ('ran', 'skipped', 'excluded')
+
+    try:
+        while len(status) < len(stages):
+            for stage in stages:
+                if stage.name in status or stage.name in running or len(running) >= jobs:
+                    continue
+                if any(status.get(name) in ('failed', 'blocked') for name in stage.after):
+                    status[stage.name] = 'blocked'
+                    print(f"{stage.name}: blocked by a failed dependency")
+                    continue
+                if not all(finished(name) for name in stage.after):
+                    continue
+                if stage.name in skip:
+                    status[stage.name] = 'excluded'
+                    continue
+                if stage.schema is not None:
+                    stage.schema.check(stage.name)
+                digest = stage_hash(stage)
+                if not stage.volatile and stage.name not in force and state.is_current(stage, digest):
+                    status[stage.name] = 'skipped'
+                    print(f"{stage.name}: inputs unchanged, skipped")
+                    continue
+                if dry_run:
+                    status[stage.name] = 'ran'
+                    print(f"{stage.name}: would run {' '.join(stage.command)}")
+                    continue
+                print(f"{stage.name}: starting")
+                process = subprocess.Popen([sys.executable] + stage.command, cwd=ROOT, env=environment,
+                                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                pump = threading.Thread(target=_pump, args=(process.stdout, stage.name, print_lock), daemon=True)
+                pump.start()
+                running[stage.name] = (stage, process, pump, digest, time.perf_counter(), time.time())
+
+            for name, (stage, process, pump, digest, start, started_at) in list(running.items()):
+                if process.poll() is None:
+                    continue
+                pump.join()
+                duration = time.perf_counter() - start
+                del running[name]
+                if process.returncode == 0 and not wrote_outputs(stage, started_at):
+                    # Not recorded, so the stage runs again once it may have something to do
+                    status[name] = 'skipped'
+                    print(f"{name}: finished in {duration:.1f}s without writing its outputs, skipped")
+                elif process.returncode == 0:
+                    state.record(stage, digest, duration)
+                    status[name] = 'ran'
+                    print(f"{name}: finished in {duration:.1f}s")
+                else:
+                    status[name] = 'failed'
+                    print(f"{name}: failed with exit code {process.returncode} after {duration:.1f}s")
+            if running:
+                time.sleep(0.05)
+    finally:
+        # Only reached with stages still running when a schema check or an interrupt aborts the run
+        for stage, process, *_ in running.values():
+            process.terminate()
+            process.wait()
+            print(f"{stage.name}: terminated")
+    return {stage.name: status[stage.name] for stage in stages if stage.name in status}
@@ -0,0 +1,95 @@
+import os
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_CSV = os.path.join(ROOT, 'Exercise 1', 'result.csv')
+RESULT_PARQUET = os.path.join(ROOT, 'Exercise 1', 'result.parquet')
+
+TEXT_COLUMNS = ['Player', 'Player ID']
+CATEGORY_COLUMNS = ['Competition', 'Season', 'Nation', 'Position', 'Team']
+
+
+def typed_frame(df):
+    """Convert the scraped string table into real nulls, numbers and categories"""
+    typed = {}
+    for column in df.columns:
+        values = df[column].replace(['', 'N/a'], np.nan)
+        if column in TEXT_COLUMNS:
+            typed[column] = values.astype('string')
+        elif column in CATEGORY_COLUMNS:
+            typed[column] = values.astype('category')
+        else:
+            typed[column] = pd.to_numeric(values.astype('string').str.replace(',', '', regex=False), errors='coerce')
+    return pd.DataFrame(typed, index=df.index)
+
+
+def write_player_table(df, path=RESULT_PARQUET):
+    typed_frame(df).to_parquet(path, index=False)
+
+
+def _parquet_is_current():
+    # A parquet file older than result.csv belongs to an earlier scrape
+    if not os.path.exists(RESULT_PARQUET):
+        return False
+    return not os.path.exists(RESULT_CSV) or os.path.getmtime(RESULT_PARQUET) >= os.path.getmtime(RESULT_CSV)
+
+
+def _parquet_reader():
+    """Return (pyarrow.parquet, pyarrow.types) when the typed table can be used, else None"""
+    if not _parquet_is_current():
+        return None
+    try:
+        import pyarrow.parquet as pq
+        import pyarrow.types as pa_types
+    except ImportError:
+        return None
+    return pq, pa_types
+
+
+def _numeric_parquet_columns(pq, pa_types, columns, exclude):
+    schema = pq.read_schema(RESULT_PARQUET)
+    return [field.name for field in schema
+            if (pa_types.is_integer(field.type) or pa_types.is_floating(field.type))
+            and field.name not in exclude and field.name not in columns]
+
+
+def load_player_table(columns=None, numeric=False, exclude=()):
+    """Load the Ex1 player table reading only the requested columns
+
+    columns lists the columns to load by name; numeric=True adds every numeric
+    column that is not in exclude. The typed parquet file is used when it is
+    current, otherwise result.csv is parsed.
+    """
+    columns = list(columns or [])
+    reader = _parquet_reader()
+    if reader is not None:
+        if numeric:
+            columns += _numeric_parquet_columns(*reader, columns, exclude)
+        return pd.read_parquet(RESULT_PARQUET, columns=columns or None)
+
+    data = pd.read_csv(RESULT_CSV, na_values=['N/a'])
+    if numeric:
+        columns += [column for column in data.select_dtypes(include=['number']).columns
+                    if column not in exclude and column not in columns]
+    return data[columns] if columns else data
+
+
+def iter_player_table(columns=None, numeric=False, exclude=(), chunk_size=10000):
+    """Yield the player table in chunks of at most chunk_size rows, with the same projection rules"""
+    columns = list(columns or [])
+    reader = _parquet_reader()
+    if reader is not None:
+        pq, pa_types = reader
+        if numeric:
+            columns += _numeric_parquet_columns(pq, pa_types, columns, exclude)
+        for batch in pq.ParquetFile(RESULT_PARQUET).iter_batches(chunk_size, columns=columns or None):
+            yield batch.to_pandas()
+        return
+
+    for chunk in pd.read_csv(RESULT_CSV, na_values=['N/a'], chunksize=chunk_size):
+        selected = list(columns)
+        if numeric:
+            selected += [column for column in chunk.select_dtypes(include=['number']).columns
+                         if column not in exclude and column not in selected]
+        yield chunk[selected] if selected else chunk
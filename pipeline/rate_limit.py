@@ -0,0 +1,58 @@
+import multiprocessing
+import threading
+import time
+
+
+class HostRateLimiter:
+    """Spaces out requests to each host by a minimum interval, across threads and processes
+
+    The limiter must be created before the worker processes start and handed to
+    them (e.g. through a pool initializer) so that every process shares the same
+    schedule of request slots.
+    """
+
+    def __init__(self, hosts, interval):
+        self.interval = interval
+        self._next_slot = {host: multiprocessing.Value('d', 0.0) for host in hosts}
+
+    def wait(self, host):
+        """Block until the caller may send its next request to host"""
+        next_slot = self._next_slot.get(host)
+        if next_slot is None or self.interval <= 0:
+            return
+        with next_slot.get_lock():
+            now = time.time()
+            slot = max(now, next_slot.value)
+            next_slot.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class TokenBucket:
+    """Token-bucket limiter shared by the threads of one process
+
+    Allows bursts of up to capacity requests while holding the long-run rate
+    to rate requests per second.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
@@ -0,0 +1,128 @@
+import json
+import os
+import time
+import pandas as pd
+
+from pipeline.player_table import ROOT, typed_frame
+
+DEFAULT_STORE_DIR = os.path.join(ROOT, 'Exercise 1', 'snapshots')
+KEY_COLUMNS = ['Competition', 'Season', 'Team']
+
+
+def player_keys(df):
+    """Stable row key: fbref player id (or name) plus team, league and season when present"""
+    key = df['Player'].astype('string')
+    if 'Player ID' in df.columns:
+        ids = df['Player ID'].astype('string')
+        key = ids.where(ids.notna() & (ids != ''), key)
+    for column in KEY_COLUMNS:
+        if column in df.columns:
+            key = key + '|' + df[column].astype('string').fillna('')
+    return key
+
+
+def row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class SnapshotStore:
+    """Append-only, versioned store of player rows that only records what changed
+
+    Every refresh writes one delta file holding the new and changed rows, plus a
+    tombstone row for every player that disappeared. The full table is rebuilt
+    from the deltas only when current_view() is asked for it.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        self.manifest_path = os.path.join(store_dir, 'manifest.json')
+
+    def manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'versions': []}
+        with open(self.manifest_path, 'r', encoding='utf-8') as handle:
+            return json.load(handle)
+
+    @property
+    def version(self):
+        versions = self.manifest()['versions']
+        return versions[-1]['version'] if versions else 0
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _previous_hashes(self, manifest):
+        if not manifest['versions']:
+            return pd.Series(dtype='uint64')
+        index = pd.read_parquet(os.path.join(self.store_dir, manifest['versions'][-1]['index']))
+        return pd.Series(index['hash'].to_numpy(), index=index['key'])
+
+    def refresh(self, df):
+        """Diff a freshly scraped table against the last snapshot and append the delta"""
+        typed = typed_frame(df).reset_index(drop=True)
+        keys = player_keys(typed)
+        if keys.duplicated().any():
+            raise ValueError(f'{keys.duplicated().sum()} duplicate player keys in the refreshed table')
+        hashes = pd.Series(row_hashes(typed), index=keys.to_numpy())
+        manifest = self.manifest()
+        previous = self._previous_hashes(manifest)
+
+        known = hashes.index.isin(previous.index)
+        changed = known & (hashes.to_numpy() != previous.reindex(hashes.index).to_numpy())
+        added = ~known
+        removed = previous.index[~previous.index.isin(hashes.index)]
+
+        summary = {'added': int(added.sum()), 'changed': int(changed.sum()), 'removed': len(removed)}
+        if not any(summary.values()):
+            return dict(summary, version=self.version)
+
+        delta = typed[added | changed].copy()
+        delta.insert(0, '_key', keys[added | changed].to_numpy())
+        delta['_deleted'] = False
+        if len(removed):
+            tombstones = pd.DataFrame({'_key': removed.to_numpy(), '_deleted': True})
+            delta = pd.concat([delta, tombstones], ignore_index=True)
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        version = manifest['versions'][-1]['version'] + 1 if manifest['versions'] else 1
+        delta_file = f'v{version:05d}.parquet'
+        index_file = f'row_hashes_v{version:05d}.parquet'
+        delta.to_parquet(os.path.join(self.store_dir, delta_file), index=False)
+        pd.DataFrame({'key': hashes.index, 'hash': hashes.to_numpy()}).to_parquet(
+            os.path.join(self.store_dir, index_file), index=False)
+        manifest['versions'].append(dict(summary, version=version, file=delta_file, index=index_file,
+                                         created_at=time.time()))
+        # The manifest is written last, so a crash mid-refresh leaves the previous version intact
+        self._write_manifest(manifest)
+        if version > 1:
+            os.remove(os.path.join(self.store_dir, manifest['versions'][-2]['index']))
+        return dict(summary, version=version)
+
+    def changes_since(self, version=0):
+        """Return the rows added, changed or removed after the given version"""
+        files = [entry['file'] for entry in self.manifest()['versions'] if entry['version'] > version]
+        if not files:
+            return pd.DataFrame(columns=['_key', '_deleted'])
+        deltas = pd.concat([pd.read_parquet(os.path.join(self.store_dir, name)) for name in files],
+                           ignore_index=True)
+        return deltas.drop_duplicates('_key', keep='last').reset_index(drop=True)
+
+    def current_view(self):
+        """Materialize the latest table from the deltas, caching it per version"""
+        version = self.version
+        if version == 0:
+            return pd.DataFrame()
+        view_path = os.path.join(self.store_dir, f'view_v{version:05d}.parquet')
+        if os.path.exists(view_path):
+            return pd.read_parquet(view_path)
+        latest = self.changes_since(0)
+        view = latest[~latest['_deleted']].drop(columns=['_key', '_deleted'])
+        view = view.sort_values('Player').reset_index(drop=True)
+        for name in os.listdir(self.store_dir):
+            if name.startswith('view_v'):
+                os.remove(os.path.join(self.store_dir, name))
+        view.to_parquet(view_path, index=False)
+        return view
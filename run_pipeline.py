@@ -0,0 +1,92 @@
+"""Single entry point for the whole pipeline: Ex1, then Ex2, Ex3 and Ex4 side by side, then valuation
+
+    python run_pipeline.py                 scrape, then rerun only the stages whose inputs moved
+    python run_pipeline.py --skip ex1      reuse the current result.csv
+    python run_pipeline.py --force ex3     rerun a stage even though its inputs are unchanged
+    python run_pipeline.py --dry-run       show what would run
+"""
+import argparse
+import sys
+
+from pipeline.orchestrator import Stage, TableSchema, SchemaError, run_pipeline
+
+PLAYER_TABLE = 'Exercise 1/result.csv'
+# What the feature store, and through it Ex2-Ex4, actually read when it is current
+PLAYER_PARQUET = 'Exercise 1/result.parquet'
+PLAYER_INPUTS = [PLAYER_TABLE, PLAYER_PARQUET]
+SHARED_CODE = ['pipeline/player_table.py', 'pipeline/feature_store.py']
+# Fetching code shared by the scrapers; a change to it must rerun them like a change to their own code
+SCRAPER_CODE = ['pipeline/http_cache.py', 'pipeline/http_session.py', 'pipeline/rate_limit.py',
+                'pipeline/browser_pool.py']
+
+
+def pipeline_stages(offline=False):
+    """The Ex1 -> {Ex2, Ex3, Ex4 -> valuation} DAG with the files each stage reads and writes"""
+    offline_flag = ['--offline'] if offline else []
+    return [
+        # fbref is the real input of Ex1 and cannot be hashed; the table it writes gates everything else
+        Stage('ex1', ['Exercise 1/Ex1.py'] + offline_flag,
+              inputs=['Exercise 1/Ex1.py', 'Exercise 1/fbref_tables.py'] + SCRAPER_CODE,
+              outputs=PLAYER_INPUTS,
+              volatile=True),
+        Stage('features', ['-m', 'pipeline.feature_store'],
+              inputs=PLAYER_INPUTS + SHARED_CODE,
+              after=['ex1'],
+              schema=TableSchema(PLAYER_TABLE, columns=['Player', 'Team', 'Position'])),
+        Stage('ex2', ['Exercise 2/Ex2.py'],
+              inputs=PLAYER_INPUTS + ['Exercise 2/Ex2.py', 'Exercise 2/histogram_renderer.py',
+                                      'Exercise 2/online_stats.py'] + SHARED_CODE,
+              outputs=['Exercise 2/results2.csv', 'Exercise 2/top_3.txt', 'Exercise 2/highest_team_stats.txt',
+                       'Exercise 2/histograms'],
+              after=['features'],
+              schema=TableSchema(PLAYER_TABLE, columns=['Player', 'Team'],
+                                 numeric=['Goals', 'Assists', 'xG', 'Tkl', 'Blocks', 'Int'])),
+        Stage('ex3', ['Exercise 3/Ex3.py'],
+              inputs=PLAYER_INPUTS + ['Exercise 3/Ex3.py', 'Exercise 3/cluster_quality.py',
+                                      'Exercise 3/cluster_model.py', 'Exercise 3/similarity.py'] + SHARED_CODE,
+              outputs=['Exercise 3/elbow_analysis.png', 'Exercise 3/cluster_visualization_2d.png'],
+              after=['features'],
+              schema=TableSchema(PLAYER_TABLE, columns=['Player', 'Position'])),
+        # Transfermarkt values expire inside Ex4's own value cache; --force ex4 refreshes them
+        Stage('ex4', ['Exercise 4/Ex4.py'] + offline_flag,
+              inputs=PLAYER_INPUTS + ['Exercise 4/Ex4.py', 'Exercise 4/name_matcher.py',
+                                      'Exercise 4/transfermarkt_crawler.py', 'Exercise 4/value_cache.py']
+                     + SHARED_CODE + SCRAPER_CODE,
+              outputs=['Exercise 4/transfer_values.csv'],
+              after=['features'],
+              schema=TableSchema(PLAYER_TABLE, columns=['Player', 'Team', 'Position'], numeric=['Minutes'])),
+        Stage('valuation', ['Exercise 4/valuation.py'],
+              inputs=PLAYER_INPUTS + ['Exercise 4/transfer_values.csv', 'Exercise 4/valuation.py'] + SHARED_CODE,
+              outputs=['Exercise 4/model/valuation.joblib', 'Exercise 4/predicted_values.csv'],
+              after=['ex4'],
+              schema=TableSchema('Exercise 4/transfer_values.csv', columns=['Player', 'Team'],
+                                 numeric=['Value_M€'])),
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run the pipeline, skipping stages whose inputs are unchanged')
+    stage_names = [stage.name for stage in pipeline_stages()]
+    arg_parser.add_argument('--force', nargs='+', choices=stage_names, default=[],
+                            help='run these stages even when their inputs are unchanged')
+    arg_parser.add_argument('--skip', nargs='+', choices=stage_names, default=[],
+                            help='treat these stages as done without running them')
+    arg_parser.add_argument('--jobs', type=int, default=None,
+                            help='stages run at the same time (default: all that are ready)')
+    arg_parser.add_argument('--offline', action='store_true',
+                            help='scrape fbref and Transfermarkt purely from cached pages')
+    arg_parser.add_argument('--dry-run', action='store_true', help='print the plan without running anything')
+    args = arg_parser.parse_args()
+
+    try:
+        status = run_pipeline(pipeline_stages(args.offline), force=args.force, skip=args.skip,
+                              jobs=args.jobs, dry_run=args.dry_run)
+    except SchemaError as e:
+        print(f"Schema check failed: {e}")
+        return 2
+    print(', '.join(f"{name}: {result}" for name, result in status.items()))
+    return 1 if any(result in ('failed', 'blocked') for result in status.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())